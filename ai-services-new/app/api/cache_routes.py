@@ -1,30 +1,30 @@
-from fastapi import APIRouter, HTTPException
-from ..services.cache_service import CacheService
+from fastapi import APIRouter, Depends, HTTPException
+from ..services.cache_service import CacheService, get_cache_service
 
 router = APIRouter(prefix="/cache", tags=["cache"])
 
-cache_service = CacheService()
+# Handlers are plain functions: CacheService talks to MongoDB synchronously, so FastAPI
+# runs them in its threadpool instead of blocking the event loop
 
 @router.get("/stats")
-async def get_cache_stats():
+def get_cache_stats(cache_service: CacheService = Depends(get_cache_service)):
     """Get cache statistics"""
     return cache_service.get_cache_stats()
 
 @router.post("/cleanup")
-async def cleanup_cache():
+def cleanup_cache(cache_service: CacheService = Depends(get_cache_service)):
     """Clean up expired cache entries"""
     cache_service.cleanup_expired_cache()
     return {"message": "Cache cleanup completed"}
 
 @router.delete("/clear")
-async def clear_cache():
+def clear_cache(cache_service: CacheService = Depends(get_cache_service)):
     """Clear all cache entries (use with caution)"""
     try:
-        if hasattr(cache_service, 'collection') and cache_service.collection is not None:
-            result = cache_service.collection.delete_many({})
-            message = f"Cleared {result.deleted_count} MongoDB cache entries"
+        deleted_count = cache_service.clear_all()
+        if cache_service.collection is not None:
+            message = f"Cleared {deleted_count} MongoDB cache entries"
         else:
-            cache_service._memory_cache.clear()
             message = "Cleared memory cache entries"
         
         return {"message": message}
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Request
 from app.models.requests import ItineraryRequest
 from app.services.itinerary_service import ItineraryService
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-def get_itinerary_service() -> ItineraryService:
-    """Dependency to get itinerary service instance"""
-    return ItineraryService()
+def get_itinerary_service(request: Request) -> ItineraryService:
+    """Dependency returning the itinerary service created at startup"""
+    return request.app.state.itinerary_service
 
 @router.post("/generate-itinerary")
 async def generate_itinerary(
@@ -14,14 +17,15 @@ async def generate_itinerary(
     service: ItineraryService = Depends(get_itinerary_service)
 ):
     """Generate travel itinerary based on user preferences"""
-    print(f"🗕️ Received Request: destination='{request.destination}' travel_dates={request.travel_dates} preferences={request.preferences} radius={request.radius}")
+    logger.info("Received request: destination=%r travel_dates=%s preferences=%s radius=%s",
+                request.destination, request.travel_dates, request.preferences, request.radius)
     
     try:
         result = await service.generate_itinerary(request)
         return result
     except ValueError as e:
-        print(f"❌ Validation error: {e}")
+        logger.warning("Validation error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
+        logger.exception("Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
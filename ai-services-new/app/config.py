@@ -1,17 +1,22 @@
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 class Settings(BaseSettings):
     google_maps_api_key: str
     rapidapi_key: str
     openweather_api_key: Optional[str] = None
+    llm_endpoint: str = "http://localhost:11434/api/generate"
+    llm_model: str = "llama3"
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
-        extra = "allow"
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False, extra="allow")
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Parse the environment once; later calls return the same Settings instance"""
+    return Settings()
+
+settings = get_settings()
 
 GOOGLE_MAPS_API_KEY = settings.google_maps_api_key
 RAPIDAPI_KEY = settings.rapidapi_key
@@ -0,0 +1,36 @@
+from cachetools import LRUCache, TTLCache
+
+# -----------------------------------------------------------------------------------------
+# Process-local caches for external API lookups
+#
+# Itinerary requests keep asking about the same handful of places, so repeated geocoding,
+# nearby-city and weather lookups are answered from memory instead of another round trip.
+# Coordinates are quantized before keying so requests a few metres apart share an entry.
+# Only successful lookups are stored, apart from the miss caches below.
+# -----------------------------------------------------------------------------------------
+
+GEOCODE_CACHE_TTL = 30 * 86400
+NEARBY_CITIES_CACHE_TTL = 86400
+WEATHER_CACHE_TTL = 1800
+OPENWEATHER_FAILURE_TTL = 60
+GEOCODE_MISS_TTL = 86400
+
+geocode_cache = TTLCache(maxsize=4096, ttl=GEOCODE_CACHE_TTL)
+reverse_geocode_cache = TTLCache(maxsize=4096, ttl=GEOCODE_CACHE_TTL)
+nearby_cities_cache = TTLCache(maxsize=4096, ttl=NEARBY_CITIES_CACHE_TTL)
+weather_cache = TTLCache(maxsize=4096, ttl=WEATHER_CACHE_TTL)
+
+# Geocoding queries Google answered with ZERO_RESULTS; repeating them is billed but cannot succeed
+geocode_misses = TTLCache(maxsize=4096, ttl=GEOCODE_MISS_TTL)
+
+# Locations where OpenWeatherMap just failed; Open-Meteo is used alone until the entry expires
+openweather_failures = TTLCache(maxsize=4096, ttl=OPENWEATHER_FAILURE_TTL)
+
+# Last ETag / Last-Modified seen per weather provider and location, with the parsed body they
+# validate. Entries outlive weather_cache so a refetch can be answered with a 304.
+weather_validators = LRUCache(maxsize=4096)
+
+
+def coord_key(lat: float, lng: float, places: int = 3) -> tuple:
+    """Quantize coordinates for use in a cache key (3 places is roughly 110 m)"""
+    return round(lat, places), round(lng, places)
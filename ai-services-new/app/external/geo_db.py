@@ -1,5 +1,41 @@
-import requests
+import asyncio
+import logging
+import os
+import random
+from itertools import islice
+from operator import itemgetter
 from app.config import settings
+from app.external.cache import coord_key, nearby_cities_cache
+from app.external.http import get_session
+from app.external.rate_limit import AsyncRateLimiter
+from app.utils import fast_json
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bound on cities kept from a response, matching the primary query's limit
+NEARBY_CITIES_LIMIT = 10
+_city_name = itemgetter("city")
+
+# Only city names are read: skip the HATEOAS link objects and pin the language so the
+# payload stays small
+_SLIM_RESPONSE_PARAMS = {"hateoasMode": "false", "languageCode": "en"}
+
+# RapidAPI's GeoDB free tier allows one request per second per key; stay just under it and
+# back off with jitter on the 429s that still slip through. The limiter is per process, so
+# the budget is split across the server's worker processes (WEB_CONCURRENCY, as uvicorn reads it).
+GEODB_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+_geodb_limiter = AsyncRateLimiter(rate=1, period=1.1 * GEODB_WORKERS)
+GEODB_MAX_ATTEMPTS = 3
+GEODB_RETRY_BASE_DELAY = 1.0
+# Per attempt, covering the wait for a rate-limit slot as well as the request itself
+GEODB_REQUEST_TIMEOUT = 10
+
+
+def _nearby_cache_key(lat: float, lng: float, radius: int) -> tuple:
+    # Nearby cities barely move, so lookups within ~1 km reuse the same answer
+    return (*coord_key(lat, lng, places=2), radius)
+
 
 class GeoDBClient:
     """Client for GeoDB API services"""
@@ -12,46 +48,71 @@ class GeoDBClient:
             "X-RapidAPI-Host": "wft-geo-db.p.rapidapi.com"
         }
     
-    def get_nearby_cities(self, lat: float, lng: float, radius: int) -> list[str]:
+    async def get_nearby_cities(self, lat: float, lng: float, radius: int) -> list[str]:
         """Get nearby cities using RapidAPI GeoDB"""
         if not self.api_key:
-            print(" No RAPIDAPI_KEY found, skipping nearby cities")
+            logger.warning("No RAPIDAPI_KEY found, skipping nearby cities")
             return []
         
+        cache_key = _nearby_cache_key(lat, lng, radius)
+        if cache_key in nearby_cities_cache:
+            # Callers extend the list, so hand out a copy
+            return list(nearby_cities_cache[cache_key])
+        
         formatted_coords = f"{lat:.4f}{lng:+.4f}" 
         
         url = f"{self.base_url}/locations/{formatted_coords}/nearbyCities"
-        params = {"radius": radius, "limit": 10, "minPopulation": 1000}
+        params = {"radius": radius, "limit": NEARBY_CITIES_LIMIT, "minPopulation": 1000, **_SLIM_RESPONSE_PARAMS}
         
         try:
-            print(f"Calling GeoDB API with coordinates: {formatted_coords}, radius: {radius}km")
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            logger.debug("Calling GeoDB API with coordinates: %s, radius: %skm", formatted_coords, radius)
+            status, body = await self._get(url, params)
             
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
+                data = fast_json.loads(body)
                 if data.get("data"):
-                    cities = [c["city"] for c in data["data"]]
-                    print(f"Found {len(cities)} nearby cities:", cities)
+                    cities = list(islice(map(_city_name, data["data"]), NEARBY_CITIES_LIMIT))
+                    logger.info("Found %d nearby cities: %s", len(cities), cities)
+                    nearby_cities_cache[cache_key] = list(cities)
                     return cities
                 else:
-                    print("GeoDB API returned no cities")
+                    logger.info("GeoDB API returned no cities")
                     return []
-            elif response.status_code == 400:
-                print(f"GeoDB API error 400 - Bad request. Trying alternative format...")
+            elif status == 400:
+                logger.warning("GeoDB API error 400 - Bad request. Trying alternative format...")
                
-                return self._get_nearby_cities_fallback(lat, lng, radius)
-            elif response.status_code == 429:
-                print("GeoDB API rate limit exceeded")
+                return await self._get_nearby_cities_fallback(lat, lng, radius)
+            elif status == 429:
+                logger.warning("GeoDB API rate limit exceeded")
                 return []
             else:
-                print(f"GeoDB API returned status {response.status_code}: {response.text}")
+                logger.warning("GeoDB API returned status %s: %s", status, body.decode(errors="replace"))
                 return []
                 
         except Exception as e:
-            print(f"Error calling GeoDB API: {e}")
+            logger.warning("Error calling GeoDB API: %s", e)
             return []
     
-    def _get_nearby_cities_fallback(self, lat: float, lng: float, radius: int) -> list[str]:
+    async def _get(self, url: str, params: dict) -> tuple:
+        """GET under the client-side rate limit, retrying 429s with exponential backoff"""
+        for attempt in range(GEODB_MAX_ATTEMPTS):
+            # A request queued behind a backlog fails fast instead of waiting for its turn indefinitely
+            status, body = await asyncio.wait_for(self._limited_get(url, params), GEODB_REQUEST_TIMEOUT)
+            
+            if status != 429 or attempt == GEODB_MAX_ATTEMPTS - 1:
+                return status, body
+            
+            delay = GEODB_RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, GEODB_RETRY_BASE_DELAY)
+            logger.debug("GeoDB API returned 429, retrying in %.1fs", delay)
+            await asyncio.sleep(delay)
+    
+    async def _limited_get(self, url: str, params: dict) -> tuple:
+        """One GET, sent once the rate limiter allows it"""
+        async with _geodb_limiter:
+            async with get_session().get(url, headers=self.headers, params=params) as response:
+                return response.status, await response.read()
+    
+    async def _get_nearby_cities_fallback(self, lat: float, lng: float, radius: int) -> list[str]:
         """Fallback method for getting nearby cities"""
         try:
          
@@ -60,22 +121,24 @@ class GeoDBClient:
                 "location": f"{lat},{lng}",
                 "radius": radius,
                 "limit": 5,
-                "minPopulation": 1000
+                "minPopulation": 1000,
+                **_SLIM_RESPONSE_PARAMS
             }
             
-            print(f"Trying fallback GeoDB API call...")
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            logger.debug("Trying fallback GeoDB API call...")
+            status, body = await self._get(url, params)
             
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
+                data = fast_json.loads(body)
                 if data.get("data"):
-                    cities = [c["city"] for c in data["data"]]
-                    print(f"🌆 Fallback found {len(cities)} cities:", cities)
+                    cities = list(islice(map(_city_name, data["data"]), NEARBY_CITIES_LIMIT))
+                    logger.info("Fallback found %d cities: %s", len(cities), cities)
+                    nearby_cities_cache[_nearby_cache_key(lat, lng, radius)] = list(cities)
                     return cities
             
-            print("Fallback GeoDB API also failed")
+            logger.warning("Fallback GeoDB API also failed")
             return []
             
         except Exception as e:
-            print(f"Fallback GeoDB API error: {e}")
+            logger.warning("Fallback GeoDB API error: %s", e)
             return []
\ No newline at end of file
@@ -1,7 +1,17 @@
-import requests
+import asyncio
+import logging
 from app.config import settings
+from app.external.cache import coord_key, geocode_cache, geocode_misses, reverse_geocode_cache
+from app.external.http import get_session
+from app.utils import fast_json
 from typing import Optional, Tuple
 
+logger = logging.getLogger(__name__)
+
+# Plan enrichment geocodes every stop at once; cap in-flight requests to stay under Google's QPS limit
+MAX_CONCURRENT_GEOCODES = 10
+_geocode_semaphore = asyncio.Semaphore(MAX_CONCURRENT_GEOCODES)
+
 class GoogleMapsClient:
     """Client for Google Maps API services"""
     
@@ -9,11 +19,15 @@ class GoogleMapsClient:
         self.api_key = settings.google_maps_api_key
         self.base_url = "https://maps.googleapis.com/maps/api"
     
-    def reverse_geocode(self, lat: float, lng: float) -> Optional[dict]:
+    async def reverse_geocode(self, lat: float, lng: float) -> Optional[dict]:
         """Get location information from coordinates using Google Geocoding API"""
         if not self.api_key:
             return None
         
+        cache_key = coord_key(lat, lng)
+        if cache_key in reverse_geocode_cache:
+            return reverse_geocode_cache[cache_key]
+        
         url = f"{self.base_url}/geocode/json"
         params = {
             "latlng": f"{lat},{lng}",
@@ -22,31 +36,32 @@ class GoogleMapsClient:
         }
         
         try:
-            r = requests.get(url, params=params, timeout=10)
-            if r.status_code == 200:
-                data = r.json()
-                if data['status'] == 'OK' and data['results']:
-                    
-                    result = data['results'][0]
-                    components = result.get('address_components', [])
-                    
-                    location_info = {}
-                    for comp in components:
-                        types = comp.get('types', [])
-                        if 'locality' in types:
-                            location_info['city'] = comp['long_name']
-                        elif 'administrative_area_level_1' in types:
-                            location_info['region'] = comp['long_name']
-                        elif 'country' in types:
-                            location_info['country'] = comp['long_name']
-                    
-                    return location_info
+            async with get_session().get(url, params=params) as r:
+                if r.status == 200:
+                    data = fast_json.loads(await r.read())
+                    if data['status'] == 'OK' and data['results']:
+                        
+                        result = data['results'][0]
+                        components = result.get('address_components', [])
+                        
+                        location_info = {}
+                        for comp in components:
+                            types = comp.get('types', [])
+                            if 'locality' in types:
+                                location_info['city'] = comp['long_name']
+                            elif 'administrative_area_level_1' in types:
+                                location_info['region'] = comp['long_name']
+                            elif 'country' in types:
+                                location_info['country'] = comp['long_name']
+                        
+                        reverse_geocode_cache[cache_key] = location_info
+                        return location_info
         except Exception as e:
-            print(f"⚠️ Reverse geocoding error: {e}")
+            logger.warning("Reverse geocoding error: %s", e)
         
         return None
     
-    def geocode(self, town: str, place: str) -> Optional[Tuple[float, float]]:
+    async def geocode(self, town: str, place: str) -> Optional[Tuple[float, float]]:
         """Try to geocode a location"""
         if not self.api_key:
             return None
@@ -54,18 +69,28 @@ class GoogleMapsClient:
         query = f"{place}, {town}".strip(", ")
         if not query:
             return None
+        
+        cache_key = f"{town.lower().strip()}|{place.lower().strip()}"
+        if cache_key in geocode_cache:
+            return geocode_cache[cache_key]
+        if cache_key in geocode_misses:
+            return None
             
         url = f"{self.base_url}/geocode/json"
         params = {"address": query, "key": self.api_key}
         
         try:
-            r = requests.get(url, params=params, timeout=10)
-            if r.status_code == 200:
-                data = r.json()
-                if data['status'] == 'OK' and data['results']:
-                    loc = data['results'][0]['geometry']['location']
-                    return loc['lat'], loc['lng']
+            async with _geocode_semaphore, get_session().get(url, params=params) as r:
+                if r.status == 200:
+                    data = fast_json.loads(await r.read())
+                    if data['status'] == 'OK' and data['results']:
+                        loc = data['results'][0]['geometry']['location']
+                        coords = loc['lat'], loc['lng']
+                        geocode_cache[cache_key] = coords
+                        return coords
+                    if data['status'] == 'ZERO_RESULTS':
+                        geocode_misses[cache_key] = True
         except Exception as e:
-            print(f"⚠️ Geocoding error for {query}: {e}")
+            logger.warning("Geocoding error for %s: %s", query, e)
         
         return None
\ No newline at end of file
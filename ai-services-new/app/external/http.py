@@ -0,0 +1,41 @@
+import aiohttp
+from typing import Optional
+
+# One session is shared by all external API clients so repeated calls to the same
+# host reuse pooled keep-alive connections instead of paying a TCP + TLS handshake
+# per request.
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# aiohttp speaks HTTP/1.1 only, so concurrency to one host comes from parallel pooled
+# sockets: allow enough per host for a full geocoding fan-out and keep idle sockets (and
+# resolved DNS) around long enough to be reused by the next itinerary request.
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 20
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the shared client session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=DEFAULT_TIMEOUT,
+            connector=aiohttp.TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL
+            )
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared client session"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -1,26 +1,57 @@
-import requests
+import aiohttp
+import asyncio
+from typing import AsyncIterator, Optional
 from app.config import settings
+from app.external.http import get_session
+from app.utils import fast_json
+
+# Generation can run long, but a stream that stops producing tokens is treated as dead.
+# The stall limit only starts once the first chunk has arrived: Ollama sends nothing while
+# the model loads and evaluates the prompt, which can take well over the limit on CPU.
+DEFAULT_LLM_TIMEOUT = aiohttp.ClientTimeout(total=120)
+LLM_STALL_TIMEOUT = 30
 
 class LLMClient:
     """Client for LLM API services"""
     
-    def __init__(self):
-        self.endpoint = settings.llm_endpoint
-        self.model = settings.llm_model
+    def __init__(self, endpoint: Optional[str] = None, model: Optional[str] = None):
+        self.endpoint = endpoint or settings.llm_endpoint
+        self.model = model or settings.llm_model
     
-    async def generate(self, prompt: str) -> dict:
-        """Send request to LLM API"""
+    async def stream(self, prompt: str, options: Optional[dict] = None,
+                     timeout: aiohttp.ClientTimeout = DEFAULT_LLM_TIMEOUT,
+                     stall_timeout: float = LLM_STALL_TIMEOUT) -> AsyncIterator[str]:
+        """Yield response chunks as the LLM produces them (Ollama NDJSON streaming)"""
+        payload = {"model": self.model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+        
         try:
-            response = requests.post(self.endpoint, json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False
-            }, timeout=30)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                raise Exception(f"LLM API returned status {response.status_code}")
+            async with get_session().post(self.endpoint, json=payload, timeout=timeout) as response:
+                if response.status != 200:
+                    raise Exception(f"LLM API returned status {response.status}")
                 
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"LLM connection failed: {e}")
\ No newline at end of file
+                read_timeout = None  # bounded only by the total timeout until the first chunk
+                while True:
+                    line = await asyncio.wait_for(response.content.readline(), read_timeout)
+                    if not line:
+                        break
+                    read_timeout = stall_timeout
+                    if not line.strip():
+                        continue
+                    chunk = fast_json.loads(line)
+                    if chunk.get("error"):
+                        raise Exception(f"LLM API error: {chunk['error']}")
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+                        
+        except aiohttp.ClientError as e:
+            raise Exception(f"LLM connection failed: {e}")
+    
+    async def generate(self, prompt: str, options: Optional[dict] = None,
+                       timeout: aiohttp.ClientTimeout = DEFAULT_LLM_TIMEOUT,
+                       stall_timeout: float = LLM_STALL_TIMEOUT) -> str:
+        """Send a prompt to the LLM and return the full generated text"""
+        return "".join([chunk async for chunk in self.stream(prompt, options, timeout, stall_timeout)])
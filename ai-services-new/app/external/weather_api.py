@@ -1,34 +1,160 @@
-import requests
+import asyncio
+import logging
+import numpy as np
+from typing import List, Optional, Tuple
 from app.config import settings
+from app.external.cache import coord_key, openweather_failures, weather_cache, weather_validators
+from app.external.http import get_session
+from app.utils import fast_json
+
+logger = logging.getLogger(__name__)
+
+# WMO weather interpretation codes used by Open-Meteo
+WEATHER_CODES = {
+    0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
+    45: "Fog", 48: "Depositing rime fog", 51: "Light drizzle", 53: "Moderate drizzle",
+    55: "Dense drizzle", 61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain",
+    71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow", 80: "Rain showers",
+    81: "Moderate rain showers", 82: "Violent rain showers", 95: "Thunderstorm",
+    96: "Thunderstorm with hail", 99: "Thunderstorm with heavy hail"
+}
+
+OPENWEATHER_FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+OPEN_METEO_FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Query parameters that never change between calls; only the coordinates are added per request
+_OPEN_METEO_PARAMS = {
+    "current": "temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m",
+    "daily": "weather_code,temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean",
+    "timezone": "auto",
+    "forecast_days": 5  # only five days are used
+}
+
+# Codes are 0-99, so descriptions and icon names are looked up by index in flat tables;
+# the icon strings are formatted once and shared across requests
+_WEATHER_CODE_TABLE = tuple(WEATHER_CODES.get(code, "Unknown") for code in range(100))
+_WEATHER_ICON_TABLE = tuple(f"{code:02d}d" for code in range(100))
+
+
+def describe_weather_code(code: int) -> str:
+    """Human-readable description for a WMO weather code"""
+    return _WEATHER_CODE_TABLE[code] if 0 <= code < 100 else "Unknown"
+
+
+def weather_icon(code: int) -> str:
+    """Icon name for a WMO weather code, e.g. 3 -> 03d"""
+    return _WEATHER_ICON_TABLE[code] if 0 <= code < 100 else f"{code:02d}d"
+
+
+def _padded(values: list, length: int, fill=0) -> list:
+    """First `length` values, padded with `fill` when the series is short"""
+    values = values[:length]
+    return values + [fill] * (length - len(values))
+
+
+def _rounded(values: list) -> list:
+    """Round a numeric series to ints (half to even, like round()).
+
+    Raises ValueError when the series has gaps (JSON nulls), like round(None) would.
+    """
+    series = np.asarray(values, dtype=float)
+    if np.isnan(series).any():
+        raise ValueError("weather series contains missing values")
+    return np.rint(series).astype(int).tolist()
+
+async def _conditional_get(url: str, params: dict, key: tuple) -> Tuple[int, Optional[dict]]:
+    """GET a JSON payload, revalidating with the stored ETag / Last-Modified when there is one.
+
+    A 304 is answered with the previously parsed body, reported as status 200.
+    """
+    validator = weather_validators.get(key)
+    headers = {}
+    if validator is not None:
+        if validator["etag"]:
+            headers["If-None-Match"] = validator["etag"]
+        if validator["last_modified"]:
+            headers["If-Modified-Since"] = validator["last_modified"]
+    
+    async with get_session().get(url, params=params, headers=headers) as response:
+        status = response.status
+        if status == 304 and validator is not None:
+            return 200, validator["data"]
+        if status != 200:
+            return status, None
+        data = fast_json.loads(await response.read())
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+    
+    if etag or last_modified:
+        weather_validators[key] = {"etag": etag, "last_modified": last_modified, "data": data}
+    return status, data
 
 class WeatherAPIClient:
     """Client for weather API services"""
     
     def __init__(self):
         self.openweather_api_key = settings.openweather_api_key
+        self._openweather_params = {
+            "appid": self.openweather_api_key,
+            "units": "metric",
+            "cnt": 16
+        }
+    
+    async def get_forecast(self, lat: float, lng: float) -> dict:
+        """Get weather forecast for the location, served from cache when recently fetched"""
+        cache_key = coord_key(lat, lng)
+        cached = weather_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        weather_info = await self._fetch_forecast(lat, lng)
+        if weather_info and weather_info.get("forecast"):
+            weather_cache[cache_key] = weather_info
+        return weather_info
     
-    def get_forecast(self, lat: float, lng: float) -> dict:
-        """Get weather forecast for the location"""
+    async def get_forecasts_bulk(self, coords: List[Tuple[float, float]]) -> list:
+        """Get forecasts for several locations concurrently; failed lookups come back as exceptions"""
+        return await asyncio.gather(
+            *[self.get_forecast(lat, lng) for lat, lng in coords],
+            return_exceptions=True
+        )
+    
+    async def _fetch_forecast(self, lat: float, lng: float) -> dict:
+        """Fetch the weather forecast, racing OpenWeatherMap against Open-Meteo when a key is set"""
         if not self.openweather_api_key:
-            print("No OPENWEATHER_API_KEY found, trying free Open-Meteo API...")
-            return self._get_weather_forecast_free(lat, lng)
+            logger.debug("No OPENWEATHER_API_KEY found, trying free Open-Meteo API...")
+            return await self._get_weather_forecast_free(lat, lng)
+        if coord_key(lat, lng, places=2) in openweather_failures:
+            logger.debug("OpenWeatherMap failed recently for %s, %s; using Open-Meteo", lat, lng)
+            return await self._get_weather_forecast_free(lat, lng)
+        
+        # Whichever provider answers first with a usable forecast wins; the other is cancelled.
+        # Open-Meteo's answer is kept as the result when neither has a forecast.
+        paid = asyncio.create_task(self._get_weather_forecast_openweather(lat, lng))
+        free = asyncio.create_task(self._get_weather_forecast_free(lat, lng))
+        pending = {paid, free}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result and result.get("forecast"):
+                        return result
+        finally:
+            for task in pending:
+                task.cancel()
         
+        return free.result()
+    
+    async def _get_weather_forecast_openweather(self, lat: float, lng: float) -> Optional[dict]:
+        """Get weather forecast from OpenWeatherMap; None when the API call fails"""
         try:
-       
-            url = "https://api.openweathermap.org/data/2.5/forecast"
-            params = {
-                "lat": lat,
-                "lon": lng,
-                "appid": self.openweather_api_key,
-                "units": "metric",  
-                "cnt": 16  
-            }
+            params = {**self._openweather_params, "lat": lat, "lon": lng}
             
-            print(f"Getting weather forecast for coordinates: {lat}, {lng}")
-            response = requests.get(url, params=params, timeout=10)
+            logger.debug("Getting weather forecast for coordinates: %s, %s", lat, lng)
+            status, data = await _conditional_get(OPENWEATHER_FORECAST_URL, params, ("openweather", coord_key(lat, lng)))
             
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
                 
                
                 weather_info = {
@@ -53,8 +179,8 @@ class WeatherAPIClient:
              
                 processed_dates = set()
                 for item in data.get("list", []):
-                    date = item["dt_txt"].split(" ")[0] 
-                    if date not in processed_dates and len(weather_info["forecast"]) < 5:
+                    date = item["dt_txt"][:10]  # "YYYY-MM-DD HH:MM:SS"
+                    if date not in processed_dates:
                         processed_dates.add(date)
                         weather_info["forecast"].append({
                             "date": date,
@@ -64,48 +190,32 @@ class WeatherAPIClient:
                             "icon": item["weather"][0]["icon"],
                             "humidity": item["main"]["humidity"]
                         })
+                        if len(weather_info["forecast"]) == 5:
+                            break
                 
-                print(f"Weather data retrieved for {weather_info['location']}")
+                logger.info("Weather data retrieved for %s", weather_info['location'])
                 return weather_info
                 
             else:
-                print(f"OpenWeatherMap API error: {response.status_code}")
-                return self._get_weather_forecast_free(lat, lng)
+                logger.warning("OpenWeatherMap API error: %s", status)
                 
         except Exception as e:
-            print(f"Error getting weather data: {e}")
-            return self._get_weather_forecast_free(lat, lng)
+            logger.warning("Error getting weather data: %s", e)
+        
+        openweather_failures[coord_key(lat, lng, places=2)] = True
+        return None
 
-    def _get_weather_forecast_free(self, lat: float, lng: float) -> dict:
+    async def _get_weather_forecast_free(self, lat: float, lng: float) -> dict:
         """Get weather forecast using free Open-Meteo API (no API key required)"""
         try:
-           
-            url = "https://api.open-meteo.com/v1/forecast"
-            params = {
-                "latitude": lat,
-                "longitude": lng,
-                "current": "temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m",
-                "daily": "weather_code,temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean",
-                "timezone": "auto",
-                "forecast_days": 7
-            }
+            params = {**_OPEN_METEO_PARAMS, "latitude": lat, "longitude": lng}
             
-            print(f"Getting free weather forecast for coordinates: {lat}, {lng}")
-            response = requests.get(url, params=params, timeout=10)
+            logger.debug("Getting free weather forecast for coordinates: %s, %s", lat, lng)
+            status, data = await _conditional_get(OPEN_METEO_FORECAST_URL, params, ("open-meteo", coord_key(lat, lng)))
             
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
                 
              
-                weather_codes = {
-                    0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-                    45: "Fog", 48: "Depositing rime fog", 51: "Light drizzle", 53: "Moderate drizzle",
-                    55: "Dense drizzle", 61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain",
-                    71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow", 80: "Rain showers",
-                    81: "Moderate rain showers", 82: "Violent rain showers", 95: "Thunderstorm",
-                    96: "Thunderstorm with hail", 99: "Thunderstorm with heavy hail"
-                }
-                
                 weather_info = {
                     "location": "Selected Location",
                     "country": "",
@@ -121,30 +231,39 @@ class WeatherAPIClient:
                         "temperature": round(current.get("temperature_2m", 0)),
                         "feels_like": round(current.get("temperature_2m", 0)),
                         "humidity": current.get("relative_humidity_2m", 0),
-                        "description": weather_codes.get(weather_code, "Unknown"),
-                        "icon": f"{weather_code:02d}d", 
+                        "description": describe_weather_code(weather_code),
+                        "icon": weather_icon(weather_code), 
                         "wind_speed": round(current.get("wind_speed_10m", 0), 1)
                     }
                 
            
                 if data.get("daily"):
                     daily = data["daily"]
-                    for i in range(min(5, len(daily.get("time", [])))):
-                        weather_code = daily["weather_code"][i] if i < len(daily.get("weather_code", [])) else 0
-                        weather_info["forecast"].append({
-                            "date": daily["time"][i],
-                            "temperature_max": round(daily["temperature_2m_max"][i]),
-                            "temperature_min": round(daily["temperature_2m_min"][i]),
-                            "description": weather_codes.get(weather_code, "Unknown"),
-                            "icon": f"{weather_code:02d}d",
-                            "humidity": round(daily["relative_humidity_2m_mean"][i]) if i < len(daily.get("relative_humidity_2m_mean", [])) else 0
-                        })
+                    dates = daily.get("time", [])[:5]
+                    days = len(dates)
+                    # Round every daily series in one NumPy pass instead of per-day round() calls
+                    temp_max = _rounded(daily["temperature_2m_max"][:days])
+                    temp_min = _rounded(daily["temperature_2m_min"][:days])
+                    humidity = _rounded(_padded(daily.get("relative_humidity_2m_mean", []), days))
+                    weather_codes = _padded(daily.get("weather_code", []), days)
+                    weather_info["forecast"] = [
+                        {
+                            "date": date,
+                            "temperature_max": high,
+                            "temperature_min": low,
+                            "description": describe_weather_code(weather_code),
+                            "icon": weather_icon(weather_code),
+                            "humidity": humid
+                        }
+                        for date, high, low, humid, weather_code
+                        in zip(dates, temp_max, temp_min, humidity, weather_codes)
+                    ]
                 
-                print(f"Free weather data retrieved successfully")
+                logger.info("Free weather data retrieved successfully")
                 return weather_info
                 
         except Exception as e:
-            print(f"Error getting free weather data: {e}")
+            logger.warning("Error getting free weather data: %s", e)
             return {
                 "location": "Unknown",
                 "country": "",
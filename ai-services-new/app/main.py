@@ -1,18 +1,60 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from app.api.middleware import setup_middleware
 from app.api.routes import health, itinerary
 from app.config import settings
+from app.external.http import close_session, get_session
+from app.services.cache_service import CacheService, get_cache_service
+from app.services.itinerary_service import ItineraryService
+from app.utils.logging_setup import start_logging, stop_logging
 import uvicorn
 from .api import cache_routes
 
 
+# Seconds between bulk writes of queued cache entries to MongoDB
+CACHE_FLUSH_INTERVAL = 0.5
+
+
+async def _flush_loop(cache_service: CacheService) -> None:
+    """Periodically write queued cache entries to MongoDB in one batch"""
+    while True:
+        await asyncio.sleep(CACHE_FLUSH_INTERVAL)
+        if cache_service.has_pending_writes():
+            await asyncio.to_thread(cache_service.flush_pending_writes)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start logging, the shared HTTP session and the services at startup; close them on shutdown"""
+    start_logging()
+    app.state.http = get_session()
+    # Built once so its cache connection and API clients are reused across requests
+    app.state.itinerary_service = ItineraryService()
+    cache_service = get_cache_service()
+    # Cache writes made while serving requests are batched by the flush loop
+    cache_service.write_behind = True
+    flush_task = asyncio.create_task(_flush_loop(cache_service))
+    yield
+    flush_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await flush_task
+    await app.state.itinerary_service.drain_cache_writes()
+    await asyncio.to_thread(cache_service.flush_pending_writes)
+    await close_session()
+    stop_logging()
+
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
     app = FastAPI(
         title="AI Travel Planner",
         version="1.0.0",
-        description="AI-powered travel itinerary generator"
+        description="AI-powered travel itinerary generator",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
     )
     
    
@@ -22,6 +64,7 @@ def create_app() -> FastAPI:
     app.include_router(health.router, tags=["health"])
     app.include_router(itinerary.router, tags=["itinerary"])
     app.include_router(cache_routes.router)
+    
     return app
 
 
@@ -33,10 +76,19 @@ if __name__ == "__main__":
     print(f"🔑 RapidAPI Key: {'✅ Set' if settings.rapidapi_key else '❌ Missing'}")
     print(f"🔑 OpenWeather API Key: {'✅ Set' if settings.openweather_api_key else '❌ Missing'}")
     
+    # Exported so each worker can size per-process budgets (e.g. the GeoDB rate limit) to its share
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    
+    # uvloop/httptools come with uvicorn[standard]; requests are logged by the app's own
+    # loggers, so the per-request access log is switched off
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        access_log=False
     )
\ No newline at end of file
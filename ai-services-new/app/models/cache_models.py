@@ -2,7 +2,7 @@ from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, Dict, Any
 import hashlib
-import json
+from app.utils import fast_json
 
 class CachedRequest(BaseModel):
     id: Optional[str] = None
@@ -23,6 +23,7 @@ class CachedRequest(BaseModel):
             "preferences": dict(sorted(preferences.items())),
             "radius": radius
         }
-        request_str = json.dumps(request_data, sort_keys=True)
-        return hashlib.sha256(request_str.encode()).hexdigest()
+        request_bytes = fast_json.dumps(request_data, sort_keys=True)
+        # 128-bit BLAKE2b: faster than SHA-256 on short inputs and halves the indexed key size
+        return hashlib.blake2b(request_bytes, digest_size=16).hexdigest()
     
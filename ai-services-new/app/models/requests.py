@@ -1,11 +1,24 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, field_validator
 from typing import List
 from datetime import date
 
+# Request models are read-only once parsed, so instances can be shared across tasks safely
+_REQUEST_MODEL_CONFIG = ConfigDict(frozen=True, str_strip_whitespace=True)
+
 class Preferences(BaseModel):
+    model_config = _REQUEST_MODEL_CONFIG
+
     interests: List[str]
 
+    @field_validator("interests")
+    @classmethod
+    def _canonical_interests(cls, interests: List[str]) -> List[str]:
+        """Sort and dedupe once at parse time so cache keys need no further normalization"""
+        return sorted(set(interests))
+
 class ItineraryRequest(BaseModel):
+    model_config = _REQUEST_MODEL_CONFIG
+
     destination: str
     travel_dates: List[date]  
     preferences: Preferences
@@ -1,12 +1,24 @@
 import os
 import logging
-from datetime import datetime
 from typing import Optional, Dict, Any
-from pprint import pprint
 import hashlib
-import json
+import threading
+from cachetools import TTLCache
+from datetime import timedelta
+from functools import lru_cache
+from app.utils import fast_json
+from app.utils.timestamps import utc_now
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logger = logging.getLogger(__name__)
+
+MONGO_MAX_POOL_SIZE = 50
+# Most cache writes that may wait for the next flush; beyond this they are written directly
+MAX_PENDING_WRITES = 1024
 """
 CacheService
 
@@ -23,14 +35,14 @@ Main Features:
 
 2. _connect:
    - Establishes a connection to the MongoDB database.
-   - Creates necessary indexes for fast lookup and expiration tracking.
+   - Creates necessary indexes for lookup, per-destination invalidation and expiration.
 
 3. _generate_hash:
    - Creates a unique hash from request parameters (destination, dates, preferences, radius).
    - Used to identify and compare identical requests for caching purposes.
 
 4. get_cached_response:
-   - Looks for a cached itinerary either in MongoDB or in-memory cache.
+   - Looks for a cached itinerary in the in-memory tier first, then in MongoDB.
    - Returns the cached data if it exists and hasn’t expired.
    - Logs whether the cache was found in memory or MongoDB.
 
@@ -40,8 +52,8 @@ Main Features:
    - Ensures identical requests retrieve the same response later.
 
 6. cleanup_expired_cache:
-   - Periodically removes entries that are expired from both MongoDB and memory.
-   - Prevents stale or unused data from accumulating over time.
+   - Removes entries that are expired from both MongoDB and memory on demand.
+   - MongoDB also expires entries on its own through the TTL index on expires_at.
 
 7. get_cache_stats:
    - Returns useful statistics about the current state of the cache.
@@ -54,13 +66,78 @@ Environment Variables:
 
 """
 
+def _request_hash(destination: str, travel_dates, preferences, radius: int) -> str:
+    request_data = {
+        "destination": destination,
+        "travel_dates": travel_dates,
+        "preferences": dict(preferences),
+        "radius": radius
+    }
+    request_bytes = fast_json.dumps(request_data, sort_keys=True)
+    # 128-bit BLAKE2b: faster than SHA-256 on short inputs and halves the indexed key size
+    return hashlib.blake2b(request_bytes, digest_size=16).hexdigest()
+
+
+# Retries and multi-step flows repeat the same request, so its hash is computed once
+_memoized_request_hash = lru_cache(maxsize=4096)(_request_hash)
+
+# Itineraries are stored in MongoDB as zstd-compressed JSON (typically 3-5x smaller than
+# the nested BSON document). Without zstandard installed they are stored as plain documents.
+if zstandard is not None:
+    _compressor = zstandard.ZstdCompressor(level=3)
+    _decompressor = zstandard.ZstdDecompressor()
+
+
+def _pack_response(response_data: Dict[str, Any]):
+    """Serialize and compress response_data for storage, when zstandard is available"""
+    if zstandard is None:
+        return response_data
+    return _compressor.compress(fast_json.dumps(response_data))
+
+
+def _unpack_response(stored) -> Optional[Dict[str, Any]]:
+    """Inverse of _pack_response; also accepts entries stored as plain documents"""
+    if not isinstance(stored, bytes):
+        return stored
+    if zstandard is None:
+        # Written by an instance with zstandard; unreadable here, so treat as a miss
+        return None
+    return fast_json.loads(_decompressor.decompress(stored))
+
+
+def cache_destination(lat: float, lng: float) -> str:
+    """Destination as stored in the cache: coordinates quantized to 0.01 deg (~1 km),
+    so repeat requests for practically the same spot share one cached itinerary"""
+    return f"Lat: {lat:.2f}, Lng: {lng:.2f}"
+
+
+def _mongo_write_ops(entries: Dict[str, Dict[str, Any]]) -> list:
+    """Bulk operations upserting cache entries under _id = request_hash"""
+    from pymongo import ReplaceOne
+    return [
+        ReplaceOne({"_id": request_hash},
+                   {**entry, "_id": request_hash, "response_data": _pack_response(entry["response_data"])},
+                   upsert=True)
+        for request_hash, entry in entries.items()
+    ]
+
+
 class CacheService:
     def __init__(self):
         self.cache_enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
         self.cache_expiry_hours = int(os.getenv("CACHE_EXPIRY_HOURS", "24"))
         self.mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
 
-        self._memory_cache = {}
+        # In-process tier in front of MongoDB (and the only tier without it): recent entries are
+        # served without a round trip. Expiry is handled by the TTLCache itself; the lock guards
+        # it across FastAPI's threadpool
+        self._memory_cache = TTLCache(maxsize=10000, ttl=self.cache_expiry_hours * 3600)
+        self._memory_lock = threading.RLock()
+
+        # Write-behind: when enabled, MongoDB writes are held here (under _memory_lock) and
+        # stored in one bulk request by flush_pending_writes, which the app calls periodically
+        self.write_behind = False
+        self._pending_writes: Dict[str, Dict[str, Any]] = {}
 
         self.client = None
         self.db = None
@@ -72,69 +149,126 @@ class CacheService:
     def _connect(self):
         try:
             from pymongo import MongoClient
-            self.client = MongoClient(self.mongodb_uri)
+            # Every call runs on a threadpool worker (40 by default); 50 sockets keep each one served
+            # tz_aware: stored expiry times come back comparable with utc_now()
+            self.client = MongoClient(self.mongodb_uri, maxPoolSize=MONGO_MAX_POOL_SIZE, tz_aware=True)
             self.db = self.client.get_database("travel_planner")
             self.collection = self.db.get_collection("cached_itineraries")
 
-            self.collection.create_index("request_hash", unique=True)
-            self.collection.create_index("expires_at")
+            # One round trip to see what exists instead of re-issuing every create_index
+            indexes = self.collection.index_information()
+            if "request_hash_1" not in indexes:
+                self.collection.create_index("request_hash", unique=True)
+            # Backs invalidation by location (delete_many on destination)
+            if "destination_1" not in indexes:
+                self.collection.create_index("destination")
+            # TTL index: MongoDB deletes documents once expires_at has passed, so no
+            # application-side sweep is needed
+            if "expires_at_1" not in indexes:
+                self.collection.create_index("expires_at", expireAfterSeconds=0)
+            elif "expireAfterSeconds" not in indexes["expires_at_1"]:
+                # Existing deployments have a plain expires_at index; convert it in place
+                self.db.command("collMod", self.collection.name,
+                                index={"keyPattern": {"expires_at": 1}, "expireAfterSeconds": 0})
+            # Entries from before the request hash became the _id carry an ObjectId, an older
+            # hash and no expiry: nothing can look them up and the TTL index never removes them
+            legacy = self.collection.delete_many({"_id": {"$type": "objectId"}})
+            if legacy.deleted_count:
+                logger.info("Removed %s legacy MongoDB cache entries", legacy.deleted_count)
 
             logger.info("✅ Connected to MongoDB at travel_planner.cached_itineraries")
         except Exception as e:
-            logger.warning(f"❌ MongoDB connection failed: {e}")
+            logger.warning("❌ MongoDB connection failed: %s", e)
             self.client = None
+            self.collection = None
 
 
-    def _generate_hash(self, destination: str, travel_dates: list, preferences: dict, radius: int) -> str:
-        """Generate a unique hash for the request parameters"""
-        request_data = {
-            "destination": destination,
-            "travel_dates": sorted(travel_dates),
-            "preferences": dict(sorted(preferences.items())),
-            "radius": radius
-        }
-        request_str = json.dumps(request_data, sort_keys=True)
-        return hashlib.sha256(request_str.encode()).hexdigest()
+    def _generate_hash(self, destination: str, travel_dates: list, preferences: dict, radius: int,
+                       namespace: str = "") -> str:
+        """Generate a unique hash for the request parameters.
+
+        A namespace keeps entries cached by different layers for the same request apart while
+        they still share the destination field that invalidation deletes by.
+        """
+        if namespace:
+            destination = f"{namespace}|{destination}"
+        try:
+            # Lists become tuples so the canonical request can key the memoized hash
+            frozen_preferences = tuple(sorted(
+                (key, tuple(value) if isinstance(value, list) else value)
+                for key, value in preferences.items()
+            ))
+            return _memoized_request_hash(destination, tuple(sorted(travel_dates)), frozen_preferences, radius)
+        except TypeError:
+            # Unhashable preference values: hash without memoizing
+            return _request_hash(destination, sorted(travel_dates), dict(sorted(preferences.items())), radius)
     
 
     def get_cached_response(self, destination: str, travel_dates: list,
-                            preferences: dict, radius: int) -> Optional[Dict[str, Any]]:
+                            preferences: dict, radius: int,
+                            memory_only: bool = False, namespace: str = "") -> Optional[Dict[str, Any]]:
+        """Cached response for the request, or None.
+
+        With memory_only=True only the in-process tier is consulted; that never blocks on
+        I/O, so it is safe to call from the event loop.
+
+        The returned dict is shared with the in-memory tier and other hits, and is not copied:
+        treat it as read-only and build a new dict (e.g. {**response, ...}) to change fields.
+        """
         if not self.cache_enabled:
             return None
 
         try:
-            request_hash = self._generate_hash(destination, travel_dates, preferences, radius)
-
-            if self.collection is not None:
-                cached = self.collection.find_one({
-                    "request_hash": request_hash,
-                    "$or": [{"expires_at": {"$gt": datetime.utcnow()}}, {"expires_at": None}]
-                })
+            request_hash = self._generate_hash(destination, travel_dates, preferences, radius, namespace)
+
+            now = utc_now()
+            with self._memory_lock:
+                entry = self._memory_cache.get(request_hash) or self._pending_writes.get(request_hash)
+                if entry is not None and entry["expires_at"] <= now:
+                    # Promoted from MongoDB with less than a full TTL left, and now past it
+                    self._memory_cache.pop(request_hash, None)
+                    entry = None
+            if entry is not None:
+                logger.info("📦 Memory cache hit for hash %s", request_hash)
+                return entry["response_data"]
+
+            if self.collection is not None and not memory_only:
+                # Entries are keyed by their hash, so this is a primary-key lookup (MongoDB's
+                # fast path that skips query planning); only the payload is pulled back. The
+                # TTL monitor runs about once a minute, so expired documents are skipped here.
+                cached = self.collection.find_one(
+                    {"_id": request_hash, "expires_at": {"$gt": now}},
+                    {"response_data": 1, "destination": 1, "expires_at": 1, "_id": 0}
+                )
                 if cached:
-                    logger.info(f"📦 MongoDB cache hit for hash {request_hash}")
-                    return cached["response_data"]
-
-            if request_hash in self._memory_cache:
-                entry = self._memory_cache[request_hash]
-                if entry["expires_at"] is None or entry["expires_at"] > datetime.utcnow():
-                    logger.info(f"📦 Memory cache hit for hash {request_hash}")
-                    return entry["response_data"]
-                else:
-                    del self._memory_cache[request_hash]
+                    response_data = _unpack_response(cached["response_data"])
+                    if response_data is not None:
+                        logger.info("📦 MongoDB cache hit for hash %s", request_hash)
+                        with self._memory_lock:
+                            # Keeps the document's expiry: the memory tier must not outlive it
+                            self._memory_cache[request_hash] = {
+                                "destination": cached.get("destination"),
+                                "response_data": response_data,
+                                "expires_at": cached["expires_at"]
+                            }
+                        return response_data
 
         except Exception as e:
-            logger.error(f"Cache retrieval error: {e}")
+            logger.error("Cache retrieval error: %s", e)
 
         return None
 
     def cache_response(self, destination: str, travel_dates: list,
-                       preferences: dict, radius: int, response_data: Dict[str, Any]) -> bool:
+                       preferences: dict, radius: int, response_data: Dict[str, Any],
+                       namespace: str = "") -> bool:
         if not self.cache_enabled:
             return False
 
         try:
-            request_hash = self._generate_hash(destination, travel_dates, preferences, radius)
-            expires_at =  None  # Keep entries forever
+            request_hash = self._generate_hash(destination, travel_dates, preferences, radius, namespace)
+            created_at = utc_now()
+            # Picked up by the TTL index on expires_at, which deletes the document once it passes
+            expires_at = created_at + timedelta(hours=self.cache_expiry_hours)
 
             entry = {
                 "request_hash": request_hash,
@@ -143,55 +277,112 @@ class CacheService:
                 "preferences": preferences,
                 "radius": radius,
                 "response_data": response_data,
-                "created_at": datetime.utcnow(),
+                "created_at": created_at,
                 "expires_at": expires_at
             }
 
+            with self._memory_lock:
+                self._memory_cache[request_hash] = entry
+
             if self.collection is not None:
-                self.collection.replace_one({"request_hash": request_hash}, entry, upsert=True)
-                logger.info(f"Cached response to MongoDB for hash: {request_hash}")
-                print("Saved MongoDB entry:")
-                pprint(entry)
+                if self.write_behind:
+                    with self._memory_lock:
+                        queued = len(self._pending_writes) < MAX_PENDING_WRITES
+                        if queued:
+                            self._pending_writes[request_hash] = entry
+                    if queued:
+                        logger.info("Queued response for MongoDB for hash: %s", request_hash)
+                        return True
+
+                self.collection.bulk_write(_mongo_write_ops({request_hash: entry}))
+                logger.info("Cached response to MongoDB for hash: %s", request_hash)
                 return True
 
-            self._memory_cache[request_hash] = entry
-            logger.info(f"Cached response to memory for hash: {request_hash}")
-            print("Saved in-memory entry:")
-            pprint(entry)
+            logger.info("Cached response to memory for hash: %s", request_hash)
             return True
 
         except Exception as e:
-            logger.error(f"Cache save error: {e}")
+            logger.error("Cache save error: %s", e)
             return False
 
+    def has_pending_writes(self) -> bool:
+        """Whether cache entries are waiting for the next flush (cheap; no lock or I/O)"""
+        return bool(self._pending_writes)
+
+    def flush_pending_writes(self) -> int:
+        """Store queued cache entries in MongoDB with a single bulk write.
+
+        On failure the batch is queued again for the next flush, up to MAX_PENDING_WRITES.
+        """
+        with self._memory_lock:
+            batch, self._pending_writes = self._pending_writes, {}
+        if not batch or self.collection is None:
+            return 0
+
+        try:
+            self.collection.bulk_write(_mongo_write_ops(batch))
+            logger.info("Flushed %s cached responses to MongoDB", len(batch))
+            return len(batch)
+        except Exception as e:
+            logger.error("Cache flush error: %s", e)
+            with self._memory_lock:
+                # Entries queued since the swap are newer and win; the rest go back in line
+                for request_hash, entry in batch.items():
+                    if len(self._pending_writes) >= MAX_PENDING_WRITES:
+                        break
+                    self._pending_writes.setdefault(request_hash, entry)
+            return 0
+
+    def evict_memory(self, destination: Optional[str] = None) -> None:
+        """Drop in-process entries, all of them or only those for one destination.
+
+        Queued write-behind entries are dropped too, so they cannot reach MongoDB afterwards.
+        Call alongside MongoDB deletes so the in-process tier does not keep serving them.
+        """
+        with self._memory_lock:
+            if destination is None:
+                self._memory_cache.clear()
+                self._pending_writes.clear()
+                return
+            for entries in (self._memory_cache, self._pending_writes):
+                stale = [key for key, entry in entries.items()
+                         if entry.get("destination") == destination]
+                for key in stale:
+                    del entries[key]
+
+    def clear_all(self) -> int:
+        """Drop every cache entry, in memory and in MongoDB; returns the MongoDB documents deleted"""
+        self.evict_memory()
+        if self.collection is None:
+            return 0
+        return self.collection.delete_many({}).deleted_count
+
     def cleanup_expired_cache(self):
         if not self.cache_enabled:
             return
         try:
             if self.collection is not None:
-                result = self.collection.delete_many({"expires_at": {"$lt": datetime.utcnow()}})
-                logger.info(f"Removed {result.deleted_count} expired MongoDB entries")
+                result = self.collection.delete_many({"expires_at": {"$lt": utc_now()}})
+                logger.info("Removed %s expired MongoDB entries", result.deleted_count)
 
-            now = datetime.utcnow()
-            expired = [k for k, v in self._memory_cache.items() if v["expires_at"] and v["expires_at"] < now]
-            for k in expired:
-                del self._memory_cache[k]
-
-            if expired:
-                logger.info(f" Removed {len(expired)} expired memory entries")
+            # Expired memory entries are dropped by the TTLCache; just purge them eagerly here
+            with self._memory_lock:
+                self._memory_cache.expire()
 
         except Exception as e:
-            logger.error(f" Cache cleanup error: {e}")
+            logger.error(" Cache cleanup error: %s", e)
 
     def get_cache_stats(self) -> Dict[str, Any]:
         if not self.cache_enabled:
             return {"cache_enabled": False}
 
         try:
-            stats = {"cache_enabled": True, "memory_entries": len(self._memory_cache)}
+            with self._memory_lock:
+                memory_entries = len(self._memory_cache)
+            stats = {"cache_enabled": True, "memory_entries": memory_entries}
             if self.collection is not None:
                 total = self.collection.count_documents({})
-                expired = self.collection.count_documents({"expires_at": {"$lt": datetime.utcnow()}})
+                expired = self.collection.count_documents({"expires_at": {"$lt": utc_now()}})
                 stats.update({
                     "mongodb_total_entries": total,
                     "mongodb_active_entries": total - expired,
@@ -199,5 +390,11 @@ class CacheService:
                 })
             return stats
         except Exception as e:
-            logger.error(f" Failed to get cache stats: {e}")
+            logger.error(" Failed to get cache stats: %s", e)
             return {"cache_enabled": True, "error": str(e)}
+
+
+@lru_cache(maxsize=1)
+def get_cache_service() -> CacheService:
+    """The process-wide CacheService, so every caller shares one MongoDB client and index setup"""
+    return CacheService()
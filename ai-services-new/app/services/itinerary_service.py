@@ -1,55 +1,125 @@
 import re
+import asyncio
+import hashlib
 import logging
+from functools import lru_cache
 from typing import Dict, Any, List, Optional, Tuple
-from datetime import date, datetime
-from app.models.requests import ItineraryRequest
+from datetime import date
+from starlette.concurrency import run_in_threadpool
+from app.models.requests import ItineraryRequest, Preferences
 from app.services.location_service import LocationService
 from app.services.weather_service import WeatherService
 from app.services.llm_service import LLMService
 from app.services.route_optimizer import RouteOptimizer
-from app.services.cache_service import CacheService
+from app.services.cache_service import cache_destination as quantized_destination, get_cache_service
+from app.utils import fast_json
+from app.utils.timestamps import utc_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Compiled once; destinations arrive as "Lat: <float>, Lng: <float>"
+_COORDS_RE = re.compile(r"Lat:\s*(-?\d+(?:\.\d*)?),\s*Lng:\s*(-?\d+(?:\.\d*)?)", re.ASCII)
+
+
+@lru_cache(maxsize=1024)
+def _formatted_date(day: date) -> str:
+    """Display form of a travel date, e.g. 'January 05, 2025'; trips keep reusing the same dates"""
+    return day.strftime('%B %d, %Y')
+
+
+# Destinations generated at once when warming the cache; each one is a full LLM generation
+CACHE_WARM_CONCURRENCY = 4
+
 class ItineraryService:
-    def __init__(self):
+    def __init__(self, cache_service=None):
+        # One instance serves every request; its services are shared with the LLM service
+        self.cache_service = cache_service or get_cache_service()
         self.location_service = LocationService()
         self.weather_service = WeatherService()
-        self.llm_service = LLMService()
+        self.llm_service = LLMService(
+            cache_service=self.cache_service,
+            weather_service=self.weather_service,
+            location_service=self.location_service
+        )
         self.route_optimizer = RouteOptimizer()
-        self.cache_service = CacheService()
+        # Cache writes still in flight; held here so the tasks are not garbage collected
+        self._cache_writes = set()
+        # Generations in progress, by cache key: identical concurrent requests share one
+        self._inflight: Dict[tuple, asyncio.Task] = {}
     
     async def generate_itinerary(self, request: ItineraryRequest) -> Dict[str, Any]:
         # Validate request
         self._validate_request(request)
         
-        sorted_dates = sorted(request.travel_dates)
-        date_strings = [str(d) for d in sorted_dates]
-        
-        # Check cache first
-        cached_response = self._check_cache(request, date_strings)
-        if cached_response:
-            logger.info(f"Cache hit for destination: {request.destination}")
-            return cached_response
-        
-        logger.info(f"Cache miss - generating new itinerary for: {request.destination}")
-        
-        # Parse coordinates and get location context
+        # Parse coordinates first: malformed destinations return before any other work, and
+        # the cache key uses the quantized coordinates
         lat, lng = self._parse_coordinates(request.destination)
         if lat is None or lng is None:
             logger.error("Invalid coordinates format")
             return {"plan": []}
+        cache_destination = quantized_destination(lat, lng)
         
-        nearby_cities, location_details = await self._get_location_context(lat, lng, request.radius)
-        
-        # Generate plan with fallback
-        raw_plan = await self._generate_plan_with_fallback(request, nearby_cities, lat, lng)
+        sorted_dates = sorted(request.travel_dates)
+        date_strings = [str(d) for d in sorted_dates]
+        # Normalized once; the same dict keys both the cache lookup and the cache write
+        preferences = RequestSignature._normalize_preferences(request.preferences)
+        
+        # Check cache first: the in-process tier answers inline, MongoDB (blocking) in the threadpool
+        cached_response = self._check_cache(request, cache_destination, date_strings, preferences,
+                                            memory_only=True)
+        if cached_response is None and self.cache_service.collection is not None:
+            cached_response = await run_in_threadpool(
+                self._check_cache, request, cache_destination, date_strings, preferences
+            )
+        if cached_response:
+            logger.info("Cache hit for destination: %s", request.destination)
+            cached_response["user_coordinates"] = {"lat": lat, "lng": lng}
+            return cached_response
         
-        # Enrich and optimize plan
-        enriched_plan = await self._enrich_and_optimize_plan(lat, lng, raw_plan, request.radius, sorted_dates)
+        # Single flight: a request identical to one already being generated waits for that result
+        # (shielded, so one client disconnecting does not cancel it for the others)
+        flight_key = (cache_destination, tuple(date_strings),
+                      fast_json.dumps(preferences, sort_keys=True), request.radius)
+        flight = self._inflight.get(flight_key)
+        if flight is not None:
+            logger.info("Joining in-flight generation for: %s", request.destination)
+            response = await asyncio.shield(flight)
+            return {**response, "user_coordinates": {"lat": lat, "lng": lng}}
+        
+        logger.info("Cache miss - generating new itinerary for: %s", request.destination)
+        flight = asyncio.create_task(self._generate_uncached(
+            request, lat, lng, cache_destination, sorted_dates, date_strings, preferences
+        ))
+        self._inflight[flight_key] = flight
+        flight.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        return await asyncio.shield(flight)
+    
+    async def _generate_uncached(self, request: ItineraryRequest, lat: float, lng: float,
+                                 cache_destination: str, sorted_dates: List[date],
+                                 date_strings: List[str], preferences: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate a new itinerary and schedule its cache write"""
+        # The forecast only depends on the coordinates; let it load while the plan is generated
+        weather_task = asyncio.create_task(
+            self.weather_service.get_forecast_for_dates(lat, lng, sorted_dates)
+        )
+        try:
+            nearby_cities, location_details = await self._get_location_context(lat, lng, request.radius)
+            
+            # Generate plan with fallback
+            raw_plan = await self._generate_plan_with_fallback(request, nearby_cities, lat, lng)
+            
+            # Enrich and optimize plan
+            enriched_plan = await self._enrich_and_optimize_plan(
+                lat, lng, raw_plan, request.radius, sorted_dates, date_strings
+            )
+            
+            forecast = await weather_task
+        finally:
+            # No-op once awaited; stops the fetch if plan generation failed
+            weather_task.cancel()
         
         # Get weather data
-        weather_data = await self._get_weather_data(lat, lng, sorted_dates, location_details)
+        weather_data = self._get_weather_data(forecast, date_strings, location_details)
         
         # Build and cache response
         response = self._build_response(
@@ -57,9 +127,19 @@ class ItineraryService:
             date_strings, len(sorted_dates), weather_data
         )
         
-        self._cache_response(request, date_strings, response)
+        # Respond without waiting for the cache write
+        write = asyncio.create_task(
+            run_in_threadpool(self._cache_response, request, cache_destination, date_strings, preferences, response)
+        )
+        self._cache_writes.add(write)
+        write.add_done_callback(self._cache_writes.discard)
         return response
     
+    async def drain_cache_writes(self) -> None:
+        """Wait for background cache writes to finish (called on shutdown)"""
+        if self._cache_writes:
+            await asyncio.gather(*self._cache_writes, return_exceptions=True)
+    
     def _validate_request(self, request: ItineraryRequest) -> None:
         """Validate the incoming request"""
         if not request.destination:
@@ -67,46 +147,48 @@ class ItineraryService:
         if not request.travel_dates or len(request.travel_dates) == 0:
             raise ValueError("At least one travel date must be provided.")
     
-    def _check_cache(self, request: ItineraryRequest, date_strings: List[str]) -> Optional[Dict[str, Any]]:
+    def _check_cache(self, request: ItineraryRequest, cache_destination: str, 
+                     date_strings: List[str], preferences: Dict[str, Any],
+                     memory_only: bool = False) -> Optional[Dict[str, Any]]:
         """Check for cached response"""
-        preferences = self._extract_preferences(request.preferences)
         cached_response = self.cache_service.get_cached_response(
-            destination=request.destination,
+            destination=cache_destination,
             travel_dates=date_strings,
             preferences=preferences,
-            radius=request.radius
+            radius=request.radius,
+            memory_only=memory_only
         )
         
         if cached_response:
-            cached_response["cache_info"] = {
+            # Shallow copy: the cached dict is shared by every hit on the in-process tier
+            cached_response = {**cached_response, "cache_info": {
                 "from_cache": True,
                 "generated_at": cached_response.get("generated_at"),
                 "cache_enabled": self.cache_service.cache_enabled
-            }
+            }}
             
         return cached_response
     
-    def _extract_preferences(self, preferences: Any) -> Dict[str, Any]:
-        """Extract preferences in a consistent format"""
-        if hasattr(preferences, 'dict'):
-            return preferences.dict()
-        elif isinstance(preferences, dict):
-            return preferences
-        return {}
-    
     async def _get_location_context(self, lat: float, lng: float, radius: int) -> Tuple[List[str], Optional[Dict]]:
         """Get nearby cities and location details"""
-        nearby_cities = await self.location_service.get_nearby_cities(lat, lng, radius)
-        location_details = await self.location_service.get_location_details(lat, lng)
+        # Either lookup may fail without taking the other (or the request) down with it
+        nearby_cities, location_details = await asyncio.gather(
+            self.location_service.get_nearby_cities(lat, lng, radius),
+            self.location_service.get_location_details(lat, lng),
+            return_exceptions=True
+        )
+        if isinstance(nearby_cities, Exception):
+            logger.warning("Nearby cities lookup failed: %s", nearby_cities)
+            nearby_cities = []
+        if isinstance(location_details, Exception):
+            logger.warning("Location details lookup failed: %s", location_details)
+            location_details = None
         
         if location_details:
-            logger.info(f"Location details: {location_details}")
+            logger.debug("Location details: %s", location_details)
             # Add location details to nearby cities
-            additional_cities = [
-                location_details.get('city', ''), 
-                location_details.get('region', '')
-            ]
-            nearby_cities.extend([city for city in additional_cities if city])
+            city, region = location_details.get('city'), location_details.get('region')
+            nearby_cities.extend(name for name in (city, region) if name)
         
         return nearby_cities, location_details
     
@@ -119,13 +201,14 @@ class ItineraryService:
                 return raw_plan
             logger.warning("LLM failed to generate plan, using fallback")
         except Exception as e:
-            logger.error(f"LLM service error: {e}")
+            logger.error("LLM service error: %s", e)
         
         # Use fallback plan - the LLMService already has fallback logic built in
         return await self.llm_service.generate_plan(request, nearby_cities)
     
     async def _enrich_and_optimize_plan(self, lat: float, lng: float, raw_plan: List[Dict], 
-                                      radius: int, sorted_dates: List[date]) -> List[Dict[str, Any]]:
+                                      radius: int, sorted_dates: List[date],
+                                      date_strings: List[str]) -> List[Dict[str, Any]]:
         """Enrich plan with location data and optimize route"""
         # Enrich with location validation
         enriched_plan = await self.location_service.enrich_and_validate_plan(
@@ -137,28 +220,25 @@ class ItineraryService:
             enriched_plan = self.route_optimizer.optimize_route((lat, lng), enriched_plan)
         
         # Update dates
-        for i, day_plan in enumerate(enriched_plan):
-            if i < len(sorted_dates):
-                day_plan['date'] = str(sorted_dates[i])
-                day_plan['formatted_date'] = sorted_dates[i].strftime('%B %d, %Y')
+        for day_plan, day, day_string in zip(enriched_plan, sorted_dates, date_strings):
+            day_plan['date'] = day_string
+            day_plan['formatted_date'] = _formatted_date(day)
         
-        logger.info(f"Generated enriched plan with {len(enriched_plan)} days")
+        logger.info("Generated enriched plan with %s days", len(enriched_plan))
         return enriched_plan
     
-    async def _get_weather_data(self, lat: float, lng: float, sorted_dates: List[date], 
-                              location_details: Optional[Dict]) -> Dict[str, Any]:
-        """Get weather forecast data"""
-        weather_data = await self.weather_service.get_forecast_for_dates(lat, lng, sorted_dates)
-        
+    def _get_weather_data(self, weather_data: Optional[Dict], date_strings: List[str], 
+                          location_details: Optional[Dict]) -> Dict[str, Any]:
+        """Shape the fetched weather forecast, falling back to an empty forecast"""
         if weather_data:
-            logger.info(f"Weather forecast included for {len(weather_data['forecast'])} days")
+            logger.info("Weather forecast included for %s days", len(weather_data['forecast']))
             return weather_data
         
         logger.info("No weather forecast available for requested dates")
         return {
             "forecast": [],
-            "location": location_details.get('city', 'Unknown') if location_details else 'Unknown',
-            "missing_dates": [str(d) for d in sorted_dates]
+            "location": (location_details or {}).get('city') or 'Unknown',
+            "missing_dates": list(date_strings)
         }
     
     def _build_response(self, enriched_plan: List[Dict], nearby_cities: List[str], 
@@ -180,11 +260,12 @@ class ItineraryService:
             }
         }
     
-    def _cache_response(self, request: ItineraryRequest, date_strings: List[str], response: Dict[str, Any]) -> None:
+    def _cache_response(self, request: ItineraryRequest, cache_destination: str, 
+                        date_strings: List[str], preferences: Dict[str, Any],
+                        response: Dict[str, Any]) -> None:
         """Cache the response"""
-        preferences = self._extract_preferences(request.preferences)
         cache_success = self.cache_service.cache_response(
-            destination=request.destination,
+            destination=cache_destination,
             travel_dates=date_strings,
             preferences=preferences,
             radius=request.radius,
@@ -192,13 +273,13 @@ class ItineraryService:
         )
         
         if cache_success:
-            logger.info(f"Successfully cached itinerary for {request.destination}")
+            logger.info("Successfully cached itinerary for %s", request.destination)
         else:
-            logger.warning(f"Failed to cache itinerary for {request.destination}")
+            logger.warning("Failed to cache itinerary for %s", request.destination)
     
     def _parse_coordinates(self, destination: str) -> Tuple[Optional[float], Optional[float]]:
         """Parse coordinates from destination string"""
-        match = re.search(r"Lat:\s*([0-9\.-]+),\s*Lng:\s*([0-9\.-]+)", destination)
+        match = _COORDS_RE.search(destination)
         if not match:
             return None, None
         
@@ -210,7 +291,7 @@ class ItineraryService:
     
     def _get_current_timestamp(self) -> str:
         """Get current timestamp in ISO format"""
-        return datetime.utcnow().isoformat()
+        return utc_timestamp()
     
     # Cache management methods - consolidated error handling
     def _execute_cache_operation(self, operation_name: str, operation_func) -> Dict[str, Any]:
@@ -220,53 +301,62 @@ class ItineraryService:
         
         try:
             result = operation_func()
-            logger.info(f"Cache operation '{operation_name}' completed successfully")
+            logger.info("Cache operation '%s' completed successfully", operation_name)
             return result
         except Exception as e:
-            logger.error(f"Cache operation '{operation_name}' failed: {e}")
+            logger.error("Cache operation '%s' failed: %s", operation_name, e)
             return {"error": str(e)}
     
     async def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        return self.cache_service.get_cache_stats()
+        return await run_in_threadpool(self.cache_service.get_cache_stats)
     
     async def clear_expired_cache(self) -> None:
         """Clear expired cache entries"""
-        self.cache_service.cleanup_expired_cache()
+        await run_in_threadpool(self.cache_service.cleanup_expired_cache)
         logger.info("Cleared expired cache entries")
     
     async def clear_all_cache(self) -> Dict[str, Any]:
         """Clear all cache entries (admin function)"""
         def clear_operation():
-            result = self.cache_service.collection.delete_many({})
-            return {"message": f"Cleared {result.deleted_count} cache entries"}
+            deleted_count = self.cache_service.clear_all()
+            return {"message": f"Cleared {deleted_count} cache entries"}
         
-        return self._execute_cache_operation("clear_all_cache", clear_operation)
+        # delete_many blocks on MongoDB; run it in the threadpool, not on the event loop
+        return await run_in_threadpool(self._execute_cache_operation, "clear_all_cache", clear_operation)
     
     async def invalidate_cache_for_location(self, destination: str) -> Dict[str, Any]:
         """Invalidate all cache entries for a specific destination"""
+        lat, lng = self._parse_coordinates(destination)
+        if lat is not None and lng is not None:
+            destination = quantized_destination(lat, lng)
+        
         def invalidate_operation():
+            # Also drops queued writes for the destination, so they cannot reappear after the delete
+            self.cache_service.evict_memory(destination)
             result = self.cache_service.collection.delete_many({"destination": destination})
             return {
                 "message": f"Invalidated {result.deleted_count} cache entries",
                 "destination": destination
             }
         
-        return self._execute_cache_operation("invalidate_cache_for_location", invalidate_operation)
+        return await run_in_threadpool(
+            self._execute_cache_operation, "invalidate_cache_for_location", invalidate_operation
+        )
     
     def is_cache_enabled(self) -> bool:
         """Check if caching is enabled"""
         return self.cache_service.cache_enabled
     
-    async def warm_cache_for_popular_destinations(self, destinations: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Pre-populate cache for popular destinations"""
+    async def warm_cache_for_popular_destinations(self, destinations: List[Dict[str, Any]],
+                                                  max_concurrency: int = CACHE_WARM_CONCURRENCY) -> Dict[str, Any]:
+        """Pre-populate cache for popular destinations, a few at a time"""
         if not self.cache_service.cache_enabled:
             return {"message": "Cache not enabled"}
         
-        warmed_count = 0
-        failed_count = 0
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        for dest_config in destinations:
+        async def warm(dest_config: Dict[str, Any]) -> bool:
             try:
                 mock_request = ItineraryRequest(
                     destination=dest_config["destination"],
@@ -275,13 +365,18 @@ class ItineraryService:
                     radius=dest_config.get("radius", 50)
                 )
                 
-                await self.generate_itinerary(mock_request)
-                warmed_count += 1
-                logger.info(f"Warmed cache for: {dest_config['destination']}")
+                async with semaphore:
+                    await self.generate_itinerary(mock_request)
+                logger.info("Warmed cache for: %s", dest_config['destination'])
+                return True
                 
             except Exception as e:
-                failed_count += 1
-                logger.error(f"Cache warming failed for {dest_config.get('destination', 'unknown')}: {e}")
+                logger.error("Cache warming failed for %s: %s", dest_config.get('destination', 'unknown'), e)
+                return False
+        
+        results = await asyncio.gather(*[warm(dest_config) for dest_config in destinations])
+        warmed_count = sum(results)
+        failed_count = len(results) - warmed_count
         
         return {
             "warmed_destinations": warmed_count,
@@ -296,9 +391,6 @@ class RequestSignature:
     @staticmethod
     def create_signature(request: ItineraryRequest) -> str:
         """Create a consistent signature for a request"""
-        import hashlib
-        import json
-        
         signature_data = {
             "destination": request.destination,
             "travel_dates": sorted([str(d) for d in request.travel_dates]),
@@ -306,24 +398,28 @@ class RequestSignature:
             "radius": request.radius
         }
         
-        signature_str = json.dumps(signature_data, sort_keys=True)
-        return hashlib.sha256(signature_str.encode()).hexdigest()
+        # Same canonical encoding and 128-bit BLAKE2b digest as CacheService's request hash
+        signature_bytes = fast_json.dumps(signature_data, sort_keys=True)
+        return hashlib.blake2b(signature_bytes, digest_size=16).hexdigest()
     
     @staticmethod
     def _normalize_preferences(preferences: Any) -> Dict[str, Any]:
         """Normalize preferences for consistent hashing"""
-        if hasattr(preferences, 'dict'):
-            pref_dict = preferences.dict()
-        elif isinstance(preferences, dict):
+        if isinstance(preferences, Preferences):
+            # Already canonical: the model sorts and dedupes interests on construction
+            return preferences.model_dump()
+        if isinstance(preferences, dict):
             pref_dict = preferences.copy()
         else:
-            pref_dict = {}
+            dump = getattr(preferences, 'model_dump', None) or getattr(preferences, 'dict', None)
+            pref_dict = dump() if dump is not None else {}
         
-        # Sort interests if present
-        if 'interests' in pref_dict and isinstance(pref_dict['interests'], list):
-            pref_dict['interests'] = sorted(pref_dict['interests'])
+        # Sort interests if present; key order needs no sorting, the hash encodes keys sorted
+        interests = pref_dict.get('interests')
+        if isinstance(interests, list):
+            pref_dict['interests'] = sorted(interests)
         
-        return dict(sorted(pref_dict.items()))
+        return pref_dict
 
 
 # Simplified test function
@@ -362,5 +458,10 @@ if __name__ == "__main__":
         stats = await service.get_cache_stats()
         print(f"Cache stats: {stats}")
     
-    import asyncio
+    # Same event loop as the server (uvicorn runs on uvloop); plain asyncio where it is unavailable
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(test_caching())
\ No newline at end of file
@@ -4,35 +4,105 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 import asyncio
 import aiohttp
-from .cache_service import CacheService
+from starlette.concurrency import run_in_threadpool
+from .cache_service import cache_destination, get_cache_service
+from ..external.llm_client import LLMClient
 from ..utils.json_repair import *
+from ..utils import fast_json
+from ..utils.geography import distances_from_km
+from ..utils.timestamps import utc_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Cache namespace of the raw LLM itineraries, apart from ItineraryService's full responses
+LLM_CACHE_NAMESPACE = "llm"
+
+# Constant prompt sections are built once at import. Only the header is formatted per
+# request; the JSON example is stitched around its two dynamic values with str.join.
+_PROMPT_HEADER = """You are an expert travel planner. Create a detailed day-by-day itinerary.
+
+LOCATION: {city}, {country}
+COORDINATES: {lat}, {lng}
+RADIUS: {radius}km
+NEARBY CITIES: {nearby}
+
+TRAVEL DETAILS:
+- Dates: {dates} ({num_days} days)
+- Group: {group_size} people
+- Budget: {budget_level}
+- Interests: {interests}
+"""
+
+_PROMPT_EXAMPLE_HEAD = '''
+
+RESPOND WITH VALID JSON ONLY:
+{
+  "plan": [
+    {
+      "day": 1,
+      "date": "'''
+
+_PROMPT_EXAMPLE_MIDDLE = '''",
+      "formatted_date": "June 15, 2025",
+      "town": "City Name",
+      "place": "Main attraction/area",
+      "activities": [
+        "Morning: Specific activity with details",
+        "Lunch: Restaurant recommendation",
+        "Afternoon: Another activity",
+        "Evening: Dinner and evening activity"
+      ],
+      "lat": 52.5200,
+      "lng": 13.4050,
+      "distance_from_start": 0.0,
+      "estimated_cost": "€50-80 per person",
+      "weather_note": "Weather-appropriate note"
+    }
+  ],
+  "summary": {
+    "total_estimated_cost": "€200-400 per person",
+    "best_season": "Spring/Summer",
+    "recommended_duration": "'''
+
+_PROMPT_EXAMPLE_TAIL = ''' days",
+    "difficulty_level": "Easy/Moderate/Challenging",
+    "transportation_tips": "Best transportation methods",
+    "cultural_notes": "Important cultural information"
+  }
+}'''
+
 class LLMService:
-    def __init__(self):
-        """Initialize the LLM service with caching and external services"""
+    def __init__(self, cache_service=None, weather_service=None, location_service=None):
+        """Initialize the LLM service with caching and external services.
+        
+        Services passed in are shared with the caller instead of building new ones.
+        """
         self.ollama_base_url = "http://localhost:11434" 
         self.model_name = "llama3"
-        self.cache_service = CacheService()
+        self.cache_service = cache_service or get_cache_service()
         self.max_retries = 3  
         self.retry_delay = 2  
         self.request_timeout = 120  
+        self.llm_client = LLMClient(
+            endpoint=f"{self.ollama_base_url}/api/generate", model=self.model_name
+        )
         
         # Initialize optional services
-        try:
-            from app.services.weather_service import WeatherService
-            self.weather_service = WeatherService()
-        except ImportError:
-            logger.warning("WeatherService not available")
-            self.weather_service = None
+        self.weather_service = weather_service
+        if self.weather_service is None:
+            try:
+                from app.services.weather_service import WeatherService
+                self.weather_service = WeatherService()
+            except ImportError:
+                logger.warning("WeatherService not available")
             
-        try:
-            from app.services.location_service import LocationService
-            self.location_service = LocationService()
-        except ImportError:
-            logger.warning("LocationService not available")
-            self.location_service = None
+        self.location_service = location_service
+        if self.location_service is None:
+            try:
+                from app.services.location_service import LocationService
+                self.location_service = LocationService()
+            except ImportError:
+                logger.warning("LocationService not available")
         
         logger.info("LLM Service initialized with caching enabled")
 
@@ -40,20 +110,29 @@ class LLMService:
                                preferences: Dict[str, Any], radius: int) -> Dict[str, Any]:
         """Generate a travel itinerary with intelligent caching and retry logic"""
         try:
+            # Keyed like ItineraryService's entries (quantized destination) so location
+            # invalidation removes both, under a namespace so the two never collide
+            lat, lng = self._parse_coordinates(destination)
+            cache_key_destination = cache_destination(lat, lng)
+            
             # Check cache first
-            cached_response = self.cache_service.get_cached_response(
-                destination, travel_dates, preferences, radius
+            cached_response = await run_in_threadpool(
+                self.cache_service.get_cached_response,
+                cache_key_destination, travel_dates, preferences, radius,
+                namespace=LLM_CACHE_NAMESPACE
             )
             
             if cached_response:
                 logger.info(f"Cache hit for destination: {destination}")
-                return cached_response
+                # Shared with the cache; callers get their own top level, nested values stay shared
+                return dict(cached_response)
             
             logger.info(f"Generating new itinerary for destination: {destination}")
             
-            lat, lng = self._parse_coordinates(destination)
-            location_info = await self._get_location_context(lat, lng, radius)
-            weather_data = await self._get_weather_forecast(lat, lng, travel_dates)
+            location_info, weather_data = await asyncio.gather(
+                self._get_location_context(lat, lng, radius),
+                self._get_weather_forecast(lat, lng, travel_dates)
+            )
             
             prompt = self._build_itinerary_prompt(
                 location_info, travel_dates, preferences, radius, weather_data
@@ -65,8 +144,10 @@ class LLMService:
             )
             
             # Cache the result
-            self.cache_service.cache_response(
-                destination, travel_dates, preferences, radius, enhanced_itinerary
+            await run_in_threadpool(
+                self.cache_service.cache_response,
+                cache_key_destination, travel_dates, preferences, radius, enhanced_itinerary,
+                namespace=LLM_CACHE_NAMESPACE
             )
             
             logger.info(f"Successfully generated and cached itinerary for {destination}")
@@ -119,18 +200,15 @@ class LLMService:
         """Parse and validate LLM response with JSON repair"""
         try:
             logger.info("Parsing LLM response...")
-            json_start = raw_response.find('{')
-            json_end = raw_response.rfind('}') + 1
+            json_str = extract_json_object(raw_response)
             
-            if json_start == -1 or json_end == 0:
+            if json_str is None:
                 logger.warning("No JSON found in response")
                 return None
             
-            json_str = raw_response[json_start:json_end]
-            
             # Try direct parsing first
             try:
-                parsed = json.loads(json_str)
+                parsed = fast_json.loads(json_str)
                 if self._validate_itinerary_structure(parsed, travel_dates):
                     logger.info("Original JSON parsed successfully!")
                     return parsed
@@ -143,14 +221,14 @@ class LLMService:
                 fix_missing_commas,
                 smart_comma_repair,
                 character_level_repair,
-                validate_and_repair_json
+                repair_json_aggressive
             ]
             
             for i, repair_func in enumerate(repair_strategies):
                 try:
                     logger.info(f"Trying repair strategy {i + 1}...")
                     repaired_json = repair_func(json_str)
-                    parsed = json.loads(repaired_json)
+                    parsed = fast_json.loads(repaired_json)
                     
                     if self._validate_itinerary_structure(parsed, travel_dates):
                         logger.info(f"Successfully repaired JSON using strategy {i + 1}")
@@ -213,7 +291,9 @@ class LLMService:
             logger.info(f"generate_plan called for {destination} with {len(travel_dates)} days")
             
             full_itinerary = await self.generate_itinerary(destination, travel_dates, preferences, radius)
-            plan = full_itinerary.get('plan', [])
+            # The day dicts belong to the cached itinerary, and the caller enriches them in
+            # place (coordinates, route, dates): hand out copies
+            plan = [dict(day) for day in full_itinerary.get('plan', [])]
             logger.info(f"Generated plan with {len(plan)} days")
             
             return plan
@@ -336,17 +416,21 @@ class LLMService:
         if not self.location_service:
             return default_context
             
-        try:
-            location_info = await self.location_service.get_location_details(lat, lng)
-            nearby_cities = await self.location_service.get_nearby_cities(lat, lng, radius)
-            
-            if location_info:
-                default_context["main_location"] = location_info
-            if nearby_cities:
-                default_context["nearby_cities"] = nearby_cities
-                
-        except Exception as e:
-            logger.warning(f"Could not get full location context: {e}")
+        # Both lookups are independent, so run them concurrently and keep whichever succeeds
+        location_info, nearby_cities = await asyncio.gather(
+            self.location_service.get_location_details(lat, lng),
+            self.location_service.get_nearby_cities(lat, lng, radius),
+            return_exceptions=True
+        )
+        
+        for result in (location_info, nearby_cities):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not get full location context: {result}")
+        
+        if location_info and not isinstance(location_info, Exception):
+            default_context["main_location"] = location_info
+        if nearby_cities and not isinstance(nearby_cities, Exception):
+            default_context["nearby_cities"] = nearby_cities
         
         return default_context
     
@@ -380,13 +464,15 @@ class LLMService:
         
         main_location = location_info.get("main_location", {"city": "Unknown", "country": "Unknown"})
         nearby_cities = location_info.get("nearby_cities", [])
+        coordinates = location_info.get("coordinates", {})
         
         # Build weather info
         weather_info = ""
         if weather_data.get("forecast"):
-            weather_info = "\n\nWeather Forecast:\n"
-            for forecast in weather_data["forecast"]:
-                weather_info += f"- {forecast.get('date')}: {forecast.get('description')}, {forecast.get('temperature')}°C\n"
+            weather_info = "\n\nWeather Forecast:\n" + "".join(
+                f"- {forecast.get('date')}: {forecast.get('description')}, {forecast.get('temperature')}°C\n"
+                for forecast in weather_data["forecast"]
+            )
         
         # Extract nearby city names
         nearby_city_names = [
@@ -394,74 +480,45 @@ class LLMService:
             for city in nearby_cities[:5]
         ]
         
-        return f"""You are an expert travel planner. Create a detailed day-by-day itinerary.
-
-LOCATION: {main_location.get('city', 'Unknown')}, {main_location.get('country', 'Unknown')}
-COORDINATES: {location_info.get('coordinates', {}).get('lat', 0)}, {location_info.get('coordinates', {}).get('lng', 0)}
-RADIUS: {radius}km
-NEARBY CITIES: {', '.join(nearby_city_names) if nearby_city_names else 'Local area'}
-
-TRAVEL DETAILS:
-- Dates: {', '.join(travel_dates)} ({len(travel_dates)} days)
-- Group: {group_size} people
-- Budget: {budget_level}
-- Interests: {', '.join(interests) if interests else 'General sightseeing'}
-{weather_info}
-
-RESPOND WITH VALID JSON ONLY:
-{{
-  "plan": [
-    {{
-      "day": 1,
-      "date": "{travel_dates[0] if travel_dates else '2025-06-15'}",
-      "formatted_date": "June 15, 2025",
-      "town": "City Name",
-      "place": "Main attraction/area",
-      "activities": [
-        "Morning: Specific activity with details",
-        "Lunch: Restaurant recommendation",
-        "Afternoon: Another activity",
-        "Evening: Dinner and evening activity"
-      ],
-      "lat": 52.5200,
-      "lng": 13.4050,
-      "distance_from_start": 0.0,
-      "estimated_cost": "€50-80 per person",
-      "weather_note": "Weather-appropriate note"
-    }}
-  ],
-  "summary": {{
-    "total_estimated_cost": "€200-400 per person",
-    "best_season": "Spring/Summer",
-    "recommended_duration": "{len(travel_dates)} days",
-    "difficulty_level": "Easy/Moderate/Challenging",
-    "transportation_tips": "Best transportation methods",
-    "cultural_notes": "Important cultural information"
-  }}
-}}"""
+        first_date = travel_dates[0] if travel_dates else '2025-06-15'
+        num_days = str(len(travel_dates))
+        
+        header = _PROMPT_HEADER.format(
+            city=main_location.get('city', 'Unknown'),
+            country=main_location.get('country', 'Unknown'),
+            lat=coordinates.get('lat', 0),
+            lng=coordinates.get('lng', 0),
+            radius=radius,
+            nearby=', '.join(nearby_city_names) if nearby_city_names else 'Local area',
+            dates=', '.join(travel_dates),
+            num_days=num_days,
+            group_size=group_size,
+            budget_level=budget_level,
+            interests=', '.join(interests) if interests else 'General sightseeing',
+        )
+        
+        return "".join((
+            header, weather_info, _PROMPT_EXAMPLE_HEAD,
+            first_date, _PROMPT_EXAMPLE_MIDDLE,
+            num_days, _PROMPT_EXAMPLE_TAIL,
+        ))
     
     async def _call_ollama(self, prompt: str) -> str:
         """Make async call to Ollama API"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.request_timeout)) as session:
-                payload = {
-                    "model": self.model_name,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "max_tokens": 4000
-                    }
-                }
+            # Streamed over the shared session: once tokens flow, a generation that stalls is cut
+            # off by the client's stall timeout instead of holding a pooled connection for the
+            # full request timeout. Model load and prompt evaluation get the full request timeout.
+            return await self.llm_client.generate(
+                prompt,
+                options={
+                    "temperature": 0.7,
+                    "top_p": 0.9,
+                    "max_tokens": 4000
+                },
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
                 
-                async with session.post(f"{self.ollama_base_url}/api/generate", json=payload) as response:
-                    if response.status != 200:
-                        raise Exception(f"Ollama API returned status {response.status}")
-                    
-                    result = await response.json()
-                    return result.get("response", "")
-                    
         except asyncio.TimeoutError:
             raise Exception("LLM request timed out")
         except Exception as e:
@@ -480,19 +537,20 @@ RESPOND WITH VALID JSON ONLY:
                     city.get("name") if isinstance(city, dict) else str(city) 
                     for city in location_info.get("nearby_cities", [])
                 ],
-                "generated_at": datetime.utcnow().isoformat(),
+                "generated_at": utc_timestamp(),
                 "cache_info": {
                     "generated_fresh": True,
                     "cache_enabled": self.cache_service.cache_enabled
                 }
             }
             
-            # Calculate distances
-            for day_plan in enhanced.get("plan", []):
-                if day_plan.get("lat") and day_plan.get("lng"):
-                    distance = self._calculate_distance(
-                        lat, lng, day_plan["lat"], day_plan["lng"]
-                    )
+            # Calculate distances for all located days in one vectorized pass
+            located = [d for d in enhanced.get("plan", []) if d.get("lat") and d.get("lng")]
+            if located:
+                distances = distances_from_km(
+                    (lat, lng), [d["lat"] for d in located], [d["lng"] for d in located]
+                )
+                for day_plan, distance in zip(located, distances.tolist()):
                     day_plan["distance_from_start"] = round(distance, 1)
             
             return enhanced
@@ -501,31 +559,14 @@ RESPOND WITH VALID JSON ONLY:
             logger.warning(f"Could not enhance itinerary: {e}")
             return itinerary or {}
     
-    def _calculate_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-        """Calculate distance between two points using Haversine formula"""
-        import math
-        
-        R = 6371  # Earth's radius in kilometers
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lng = math.radians(lng2 - lng1)
-        
-        a = (math.sin(delta_lat / 2) ** 2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        return R * c
-    
     async def get_cached_itinerary_count(self) -> int:
         """Get count of cached itineraries"""
-        stats = self.cache_service.get_cache_stats()
+        stats = await run_in_threadpool(self.cache_service.get_cache_stats)
         return stats.get("mongodb_active_entries", stats.get("memory_entries", 0))
     
     async def clear_expired_cache(self) -> None:
         """Clear expired cache entries"""
-        self.cache_service.cleanup_expired_cache()
+        await run_in_threadpool(self.cache_service.cleanup_expired_cache)
     
     def is_cache_enabled(self) -> bool:
         """Check if caching is enabled"""
@@ -1,8 +1,20 @@
 import re
+import asyncio
+import logging
 from app.external.google_maps import GoogleMapsClient
 from app.external.geo_db import GeoDBClient
 from app.utils.geography import calculate_distance_km
 
+logger = logging.getLogger(__name__)
+
+_LOCATION_CONTEXT_TAIL = """
+        PLEASE SUGGEST:
+        - Specific named landmarks, museums, restaurants
+        - Real street names and addresses where possible  
+        - Local specialties and traditional dishes
+        - Historical sites with cultural significance
+        - Authentic local experiences"""
+
 class LocationService:
     
     def __init__(self):
@@ -10,57 +22,89 @@ class LocationService:
         self.geo_db = GeoDBClient()
     
     async def get_nearby_cities(self, lat: float, lng: float, radius: int) -> list[str]:
-        return self.geo_db.get_nearby_cities(lat, lng, radius)
+        return await self.geo_db.get_nearby_cities(lat, lng, radius)
     
     async def get_location_details(self, lat: float, lng: float) -> dict:
-        return self.google_maps.reverse_geocode(lat, lng)
+        return await self.google_maps.reverse_geocode(lat, lng)
         
     async def enrich_and_validate_plan(self, start_coords: tuple, days: list, radius_km: int) -> list:
         """
         Enrich plan with real coordinates. Never lie about locations.
-        """
-        enriched = []
         
+        Each distinct (town, place) is geocoded once, all of them concurrently,
+        and each stop is validated as soon as its lookup lands so the distance
+        checks overlap the remaining network waits.
+        """
+        # LLM plans often repeat the same stop on several days
+        days_by_stop = {}
         for day in days:
-            coords = self._find_coordinates(day)
-            
-            # Calculate distance to real location
-            distance_km = calculate_distance_km(start_coords, coords)
-            
-            # Assign real coordinates (never fake them)
-            day['lat'], day['lng'] = coords
-            day['distance_from_start'] = round(distance_km, 1)
-            
-            # Log if outside radius but keep real coordinates
-            status = "✅" if distance_km <= radius_km else "⚠️ OUTSIDE RADIUS"
-            
-            print(f"📍 Day {day['day']}: {day.get('place', 'Unknown')} in {day.get('town', 'Unknown')}")
-            print(f"   Real coordinates: ({day['lat']:.4f}, {day['lng']:.4f})")
-            print(f"   Distance: {distance_km:.1f}km from start {status}")
+            days_by_stop.setdefault(self._stop_key(day), []).append(day)
+        
+        pending = [self._resolve_stop(key, stop_days[0]) for key, stop_days in days_by_stop.items()]
+        
+        for next_done in asyncio.as_completed(pending):
+            key, coords = await next_done
             
-            enriched.append(day)
+            for day in days_by_stop[key]:
+                if isinstance(coords, BaseException):
+                    logger.warning("Geocoding failed for day %s: %s", day.get('day'), coords)
+                    day_coords = (0, 0)
+                else:
+                    day_coords = coords
+                
+                # Calculate distance to real location
+                distance_km = calculate_distance_km(start_coords, day_coords)
+                
+                # Assign real coordinates (never fake them)
+                day['lat'], day['lng'] = day_coords
+                day['distance_from_start'] = round(distance_km, 1)
+                
+                # Log if outside radius but keep real coordinates
+                status = "✅" if distance_km <= radius_km else "⚠️ OUTSIDE RADIUS"
+                
+                logger.debug("Day %s: %s in %s, real coordinates (%.4f, %.4f), %.1fkm from start %s",
+                             day['day'], day.get('place', 'Unknown'), day.get('town', 'Unknown'),
+                             day['lat'], day['lng'], distance_km, status)
         
-        return enriched
+        # Days were updated in place, so the original plan order is preserved
+        return list(days)
+    
+    async def _resolve_stop(self, key: tuple, day: dict) -> tuple:
+        """Geocode one stop, returning its key alongside the coordinates or the error"""
+        try:
+            return key, await self._find_coordinates(day)
+        except Exception as e:
+            return key, e
+    
+    def _stop_key(self, day: dict) -> tuple:
+        """Normalized (town, place) identifying a stop for geocoding"""
+        return (
+            (day.get('town') or '').strip().lower(),
+            (day.get('place') or '').strip().lower()
+        )
     
-    def _find_coordinates(self, day: dict) -> tuple:
+    async def _find_coordinates(self, day: dict) -> tuple:
         """
         Find real coordinates using multiple strategies. Never return fake coordinates.
+        
+        Strategies run in order and stop at the first hit, so a stop costs at most three
+        Geocoding requests; queries Google has no result for are remembered and not re-sent.
         """
         # Strategy 1: Try full address (town + place)
         if day.get('town') and day.get('place'):
-            coords = self.google_maps.geocode(day['town'], day['place'])
+            coords = await self.google_maps.geocode(day['town'], day['place'])
             if coords:
                 return coords
         
         # Strategy 2: Try place only
         if day.get('place'):
-            coords = self._geocode_single(day['place'])
+            coords = await self._geocode_single(day['place'])
             if coords:
                 return coords
         
         # Strategy 3: Try town only
         if day.get('town'):
-            coords = self._geocode_single(day['town'])
+            coords = await self._geocode_single(day['town'])
             if coords:
                 return coords
         
@@ -71,10 +115,10 @@ class LocationService:
         
         return (0, 0)
     
-    def _geocode_single(self, location_name: str) -> tuple:
+    async def _geocode_single(self, location_name: str) -> tuple:
         """Geocode a single location name"""
         try:
-            return self.google_maps.geocode_single_location(location_name)
+            return await self.google_maps.geocode("", location_name)
         except Exception:
             return None
     
@@ -87,10 +131,4 @@ class LocationService:
             return None
     
     def get_location_context(self, destination: str) -> str:
-        return """
-        PLEASE SUGGEST:
-        - Specific named landmarks, museums, restaurants
-        - Real street names and addresses where possible  
-        - Local specialties and traditional dishes
-        - Historical sites with cultural significance
-        - Authentic local experiences"""
\ No newline at end of file
+        return _LOCATION_CONTEXT_TAIL
\ No newline at end of file
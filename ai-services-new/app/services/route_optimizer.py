@@ -1,4 +1,13 @@
-from app.utils.geography import calculate_distance_km
+import logging
+from itertools import permutations
+import numpy as np
+from app.utils.geography import haversine_matrix
+
+logger = logging.getLogger(__name__)
+
+# Up to this many stops every visiting order is tried (at most 3! = 6), which is exact and
+# cheaper than the nearest-neighbour pass plus 2-opt sweeps
+EXACT_ROUTE_MAX_STOPS = 3
 
 class RouteOptimizer:
     """
@@ -7,7 +16,7 @@ class RouteOptimizer:
     This class provides functionality to reorder a list of daily travel destinations 
     such that the total distance traveled over the course of the trip is minimized. 
     It uses a greedy algorithm similar to the Nearest Neighbor heuristic from 
-    the Traveling Salesperson Problem (TSP).
+    the Traveling Salesperson Problem (TSP), refined with 2-opt segment reversals.
 
     Method:
     --------
@@ -20,10 +29,13 @@ class RouteOptimizer:
         - Process:
             1. Begins at the user's starting coordinates.
             2. Iteratively selects the "nearest" unvisited location (by great-circle distance)
-               using the Haversine formula.
-            3. Updates the day's 'travel_distance_km' with the distance from the previous location.
-            4. Appends this day's plan to the `optimized_route` list and removes it from the pool.
-            5. Repeats the process until all days are ordered.
+               using a Haversine distance matrix computed once for all points.
+            3. Repeats the process until all days are ordered.
+            4. Refines the greedy order with 2-opt: reverses any segment of the route
+               whose reversal shortens the total distance, until no such segment remains.
+               (Trips of up to EXACT_ROUTE_MAX_STOPS stops skip steps 2-4: every order is
+               compared directly, which is exact.)
+            5. Updates each day's 'travel_distance_km' with the distance from the previous location.
             6. Annotates each day with:
                 - `day`: the day number in the optimized sequence.
                 - `route`: a cumulative route history with coordinates visited so far.
@@ -38,13 +50,14 @@ class RouteOptimizer:
     Assumptions:
     ------------
     - All entries in `days` contain valid 'lat' and 'lng' keys.
-    - `calculate_distance_km()` is a utility function (using Haversine formula) 
+    - `haversine_matrix()` is a utility function (vectorized Haversine formula) 
       available in the current scope.
 
     Limitations:
     ------------
-    - This is a greedy approximation and may not produce the globally optimal route
-      for large or complex datasets, but is fast and effective for small trips (3–10 days).
+    - This is a heuristic (nearest neighbor + 2-opt) and may not produce the globally
+      optimal route for large or complex datasets, but is fast and effective for small
+      trips (3–10 days).
     - Does not account for time windows, traffic, or transportation modes.
     """
     
@@ -53,29 +66,40 @@ class RouteOptimizer:
         if len(days) <= 1:
             return days
       
-        remaining = days.copy()
-        current_location = start_coords
-        optimized_route = []
+        # Row/column 0 is the user's start, i + 1 is days[i]
+        distances = haversine_matrix(
+            [start_coords[0]] + [day['lat'] for day in days],
+            [start_coords[1]] + [day['lng'] for day in days]
+        )
         
-        print(f"Starting route optimization from {start_coords}")
+        logger.debug("Starting route optimization from %s", start_coords)
         
-  
-        while remaining:
-         
-            closest_day = min(remaining, key=lambda day: 
-                calculate_distance_km(current_location, (day['lat'], day['lng'])))
+        if len(days) <= EXACT_ROUTE_MAX_STOPS:
+            order = self._shortest_order(len(days), distances)
+        else:
+            remaining = list(range(1, len(days) + 1))
+            order = [0]
             
-            travel_distance = calculate_distance_km(current_location, (closest_day['lat'], closest_day['lng']))
+            while remaining:
+             
+                closest = remaining.pop(int(np.argmin(distances[order[-1], remaining])))
+                order.append(closest)
+            
+            order = self._two_opt(order, distances)
+        
+        optimized_route = []
+        for previous, current in zip(order, order[1:]):
+            closest_day = days[current - 1]
+            
+            travel_distance = float(distances[previous, current])
             
             closest_day['travel_distance_km'] = round(travel_distance, 1) if optimized_route else 0
             
             optimized_route.append(closest_day)
-            remaining.remove(closest_day)
-            current_location = (closest_day['lat'], closest_day['lng'])
             
-            print(f"📍 Added Day {len(optimized_route)}: {closest_day['place']} "
-                  f"[{closest_day['distance_from_start']}km from USER coordinates, "
-                  f"{closest_day['travel_distance_km']}km travel from previous location]")
+            logger.debug("Added Day %d: %s [%skm from USER coordinates, %skm travel from previous location]",
+                         len(optimized_route), closest_day['place'],
+                         closest_day['distance_from_start'], closest_day['travel_distance_km'])
         
         total_travel_distance = 0
         for i, day in enumerate(optimized_route):
@@ -85,6 +109,37 @@ class RouteOptimizer:
             if i > 0:
                 total_travel_distance += day['travel_distance_km']
         
-        print(f" Route optimized! Total travel distance: {total_travel_distance:.1f}km")
+        logger.info("Route optimized! Total travel distance: %.1fkm", total_travel_distance)
+        
+        return optimized_route
+    
+    def _shortest_order(self, stops: int, distances) -> list:
+        """Exact shortest open path from the start (index 0) through every stop"""
+        best = min(
+            permutations(range(1, stops + 1)),
+            key=lambda path: sum(distances[a, b] for a, b in zip((0,) + path, path))
+        )
+        return [0, *best]
+    
+    def _two_opt(self, order: list, distances) -> list:
+        """Reverse route segments while doing so shortens the path; order[0] (the start) stays fixed"""
+        last = len(order) - 1
+        improved = True
+        
+        while improved:
+            improved = False
+            for i in range(1, last):
+                for j in range(i + 1, last + 1):
+                    a, b, c = order[i - 1], order[i], order[j]
+                    # The path is open, so reversing up to the last stop only changes one edge
+                    if j == last:
+                        delta = distances[a, c] - distances[a, b]
+                    else:
+                        d = order[j + 1]
+                        delta = distances[a, c] + distances[b, d] - distances[a, b] - distances[c, d]
+                    
+                    if delta < -1e-9:
+                        order[i:j + 1] = order[i:j + 1][::-1]
+                        improved = True
         
-        return optimized_route
\ No newline at end of file
+        return order
@@ -1,7 +1,10 @@
+import logging
 from datetime import date, datetime
 from typing import List, Optional
 from app.external.weather_api import WeatherAPIClient
 
+logger = logging.getLogger(__name__)
+
 class WeatherService:
     """Service for handling weather data"""
     
@@ -12,10 +15,10 @@ class WeatherService:
         """Get weather forecast for specific dates"""
         try:
            
-            weather_data = self.weather_client.get_forecast(lat, lng)
+            weather_data = await self.weather_client.get_forecast(lat, lng)
             
             if not weather_data or not weather_data.get('forecast'):
-                print("⚠️ No weather forecast available")
+                logger.warning("No weather forecast available")
                 return None
             
            
@@ -40,7 +43,7 @@ class WeatherService:
             missing_dates = [d for d in travel_dates if d not in available_dates]
             
             if missing_dates:
-                print(f"⚠️ Weather forecast not available for dates: {missing_dates}")
+                logger.info("Weather forecast not available for dates: %s", missing_dates)
             
             if filtered_forecasts:
                 return {
@@ -51,9 +54,9 @@ class WeatherService:
                     "missing_dates": [str(d) for d in missing_dates]
                 }
             else:
-                print("⚠️ No weather forecasts available for any of the requested dates")
+                logger.info("No weather forecasts available for any of the requested dates")
                 return None
                 
         except Exception as e:
-            print(f"⚠️ Error getting weather forecast: {e}")
+            logger.warning("Error getting weather forecast: %s", e)
             return None
\ No newline at end of file
@@ -0,0 +1,29 @@
+import json
+
+# -----------------------------------------------------------------------------------------
+# JSON helpers backed by orjson
+#
+# orjson parses in native code and is several times faster than the stdlib json module
+# on the multi-KB payloads we get from the LLM and the external APIs. Its
+# JSONDecodeError subclasses json.JSONDecodeError, so callers can keep catching the
+# stdlib exception. When orjson is not installed the stdlib module is used instead.
+# -----------------------------------------------------------------------------------------
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Parse a JSON document from str or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, sort_keys: bool = False) -> bytes:
+    """Serialize obj to compact UTF-8 JSON bytes, identical with or without orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False).encode()
@@ -1,4 +1,14 @@
 import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Stand-in used when Numba is not installed: leaves the function as plain Python"""
+        def decorator(func):
+            return func
+        return decorator
 
 # -----------------------------------------------------------------------------------------
 # Haversine Formula - Explained
@@ -43,11 +53,62 @@ def calculate_distance_km(coord1, coord2):
     lat1, lon1 = coord1
     lat2, lon2 = coord2
     
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    return _haversine_km(float(lat1), float(lon1), float(lat2), float(lon2))
+
+
+# Scalar kernel, JIT-compiled to native code when Numba is available
+@njit(cache=True, fastmath=True)
+def _haversine_km(lat1, lon1, lat2, lon2):
+    
+    lat1, lon1, lat2, lon2 = math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2)
     
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
     c = 2 * math.asin(math.sqrt(a))
     
-    return c * 6371  
+    return c * 6371
+
+
+# Compile at import so the first request doesn't pay the JIT cost
+_haversine_km(0.0, 0.0, 0.0, 0.0)
+
+
+# -----------------------------------------------------------------------------------------
+# Pairwise Haversine distances
+#
+# Same formula as above, evaluated for every pair of points at once with NumPy
+# broadcasting ((N,1) against (1,N)). Callers that need many distances between the
+# same set of points (e.g. the route optimizer) compute the matrix once and index it
+# instead of recomputing the trigonometry for every comparison.
+#
+# Inputs:
+#   lats, lngs: sequences of latitudes / longitudes in degrees, same length N
+#
+# Output:
+#   (N, N) array of distances in kilometers
+# -----------------------------------------------------------------------------------------
+
+
+def haversine_matrix(lats, lngs):
+
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat/2)**2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng/2)**2
+
+    return 6371 * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distances_from_km(origin, lats, lngs):
+    """Haversine distance in km from a single origin to each of N points, as an (N,) array"""
+
+    lat1, lon1 = map(math.radians, origin)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lngs, dtype=float))
+
+    a = np.sin((lat2 - lat1)/2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2)**2
+
+    return 6371 * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -1,20 +1,69 @@
 import json
+import logging
 import re
-from typing import Tuple
+from typing import Optional, Tuple
 import asyncio
 
+logger = logging.getLogger(__name__)
+
+# Patterns are compiled once at import; repairs run on every malformed LLM response
+# One pass for all line-break comma fixes: `"`, `]` or `}` before a line starting with `"`,
+# and `}` before a line starting with `{`. The next token is only looked at, never consumed.
+_RE_NEWLINE_COMMA = re.compile(r'(\}|[\]"](?=\s*\n\s*"))\s*\n\s*(?=["{])')
+_RE_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_RE_ADJACENT_OBJECTS = re.compile(r'\}\s*\{')
+_RE_JSON_STRUCTURE = re.compile(r'[{}"\\]')
+# A value that ends a line followed by a line starting a key/string (or an object after an object)
+_RE_MISSING_LINE_COMMA = re.compile(r'["\]}][^\S\n]*(?=\n[^\S\n]*")|\}[^\S\n]*(?=\n[^\S\n]*\{)')
+
+# -----------------------
+# Locating the JSON Payload
+# -----------------------
+
+def extract_json_object(text: str) -> Optional[str]:
+    """Return the first balanced top-level {...} in text, ignoring braces inside strings.
+
+    Only structural characters are visited (found by one compiled regex), so the scan is a
+    single linear pass. If the object never closes, e.g. a truncated response, the span up
+    to the last closing brace is returned so the repair strategies can still work on it.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    skip_to = -1
+    for match in _RE_JSON_STRUCTURE.finditer(text, start):
+        i = match.start()
+        if i < skip_to:
+            continue
+        char = text[i]
+        if char == '\\':
+            skip_to = i + 2
+        elif char == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+
+    end = text.rfind('}')
+    return text[start:end + 1] if end > start else None
+
 # -----------------------
 # Basic JSON Cleanups
 # -----------------------
 
 def repair_json_basic(json_str: str) -> str:
     """Apply simple regex-based JSON repairs for common newline/comma issues."""
-    print("Applying basic JSON repairs...")
-    json_str = re.sub(r'(")\s*\n\s*(")', r'\1,\n\2', json_str)
-    json_str = re.sub(r'(\])\s*\n\s*(")', r'\1,\n\2', json_str)
-    json_str = re.sub(r'(\})\s*\n\s*(")', r'\1,\n\2', json_str)
-    json_str = re.sub(r'(\})\s*\n\s*(\{)', r'\1,\n\2', json_str)
-    json_str = re.sub(r',\s*([}\]])', r'\1', json_str)
+    logger.debug("Applying basic JSON repairs...")
+    json_str = _RE_NEWLINE_COMMA.sub(r'\1,\n', json_str)
+    json_str = _RE_TRAILING_COMMA.sub(r'\1', json_str)
     return json_str
 
 # -----------------------
@@ -23,24 +72,28 @@ def repair_json_basic(json_str: str) -> str:
 
 def smart_comma_repair(json_str: str) -> str:
     """Attempts to insert missing commas between JSON lines using structure clues."""
-    print("Applying smart comma repair...")
-    lines = json_str.split('\n')
+    logger.debug("Applying smart comma repair...")
     repaired = []
+    prev_idx = None  # index in `repaired` of the last non-blank line
 
-    for i, line in enumerate(lines):
+    # Single forward pass: each non-blank line decides whether the previous one needs a comma
+    for line in json_str.split('\n'):
         current = line.rstrip()
-        next_line = next((l.strip() for l in lines[i + 1:] if l.strip()), None)
-        if next_line:
+        next_line = current.lstrip()
+        if next_line and prev_idx is not None:
+            prev = repaired[prev_idx]
             needs_comma = (
-                (current.endswith('"') and next_line.startswith('"') and ':' in next_line and not current.endswith('",')) or
-                (current.endswith(']') and next_line.startswith('"') and ':' in next_line and not current.endswith('],')) or
-                (current.endswith('}') and next_line.startswith('{') and not current.endswith('},')) or
-                (current.endswith('}') and next_line.startswith('"') and ':' in next_line and not current.endswith('},'))
+                (prev.endswith('"') and next_line.startswith('"') and ':' in next_line and not prev.endswith('",')) or
+                (prev.endswith(']') and next_line.startswith('"') and ':' in next_line and not prev.endswith('],')) or
+                (prev.endswith('}') and next_line.startswith('{') and not prev.endswith('},')) or
+                (prev.endswith('}') and next_line.startswith('"') and ':' in next_line and not prev.endswith('},'))
             )
             if needs_comma:
-                current += ','
-                print(f"Added comma to line {i + 1}")
+                repaired[prev_idx] = prev + ','
+                logger.debug("Added comma to line %d", prev_idx + 1)
         repaired.append(current)
+        if next_line:
+            prev_idx = len(repaired) - 1
 
     return '\n'.join(repaired)
 
@@ -50,20 +103,20 @@ def smart_comma_repair(json_str: str) -> str:
 
 def character_level_repair(json_str: str) -> str:
     """Locates the error position and tries inserting a comma before a next valid JSON element."""
-    print("Applying character-level repair...")
+    logger.debug("Applying character-level repair...")
     try:
         json.loads(json_str)
         return json_str  
     except json.JSONDecodeError as e:
         error_pos = getattr(e, 'pos', 0)
-        print(f" JSON error at position {error_pos}")
+        logger.debug("JSON error at position %d", error_pos)
         for i in range(error_pos - 1, -1, -1):
             if json_str[i] in '"]}':
                 for j in range(error_pos, len(json_str)):
                     if json_str[j] not in ' \t\n\r':
                         if json_str[j] in '"{[':
                             repaired = json_str[:i+1] + ',' + json_str[i+1:]
-                            print(f" Inserted comma at position {i + 1}")
+                            logger.debug("Inserted comma at position %d", i + 1)
                             return repaired
                         break
                 break
@@ -75,23 +128,24 @@ def character_level_repair(json_str: str) -> str:
 
 def repair_json_aggressive(json_str: str) -> str:
     """Heuristically repairs broken JSON by trimming to the main object, balancing brackets, and deduplicating commas."""
-    print("Applying aggressive JSON repairs...")
+    logger.debug("Applying aggressive JSON repairs...")
     try:
         json_str = repair_json_basic(json_str)
-        match = re.search(r'\{.*\}', json_str, re.DOTALL)
-        json_str = match.group() if match else json_str.strip()
+        # Outermost braces via find/rfind: same span as a greedy DOTALL search, one C scan each
+        start, end = json_str.find('{'), json_str.rfind('}')
+        json_str = json_str[start:end + 1] if start != -1 and end > start else json_str.strip()
 
         json_str += '}' * (json_str.count('{') - json_str.count('}'))
         json_str += ']' * (json_str.count('[') - json_str.count(']'))
 
-        json_str = re.sub(r',\s*([}\]])', r'\1', json_str)
+        json_str = _RE_TRAILING_COMMA.sub(r'\1', json_str)
 
-        json_str = re.sub(r'\}\s*\{', r'},\n{', json_str)
+        json_str = _RE_ADJACENT_OBJECTS.sub(r'},\n{', json_str)
 
         return json_str
 
     except Exception as e:
-        print(f"Error in aggressive JSON repair: {e}")
+        logger.warning("Error in aggressive JSON repair: %s", e)
         return json_str
 
 # -----------------------
@@ -100,21 +154,8 @@ def repair_json_aggressive(json_str: str) -> str:
 
 def fix_missing_commas(json_str: str) -> str:
     """Fixes missing commas between dictionary/object entries based on structure."""
-    print("Fixing missing commas...")
-    lines = json_str.split('\n')
-    fixed = []
-
-    for i, line in enumerate(lines):
-        fixed.append(line)
-        if i < len(lines) - 1:
-            curr, nxt = lines[i].strip(), lines[i + 1].strip()
-            if curr and nxt:
-                if (curr.endswith('"') or curr.endswith(']') or curr.endswith('}')) and nxt.startswith('"') and not curr.endswith(','):
-                    fixed[-1] = line + ','
-                if curr.endswith('}') and nxt.startswith('{') and not curr.endswith(','):
-                    fixed[-1] = line + ','
-
-    return '\n'.join(fixed)
+    logger.debug("Fixing missing commas...")
+    return _RE_MISSING_LINE_COMMA.sub(r'\g<0>,', json_str)
 
 # -----------------------
 # Validate and Repair JSON
@@ -137,13 +178,13 @@ async def validate_and_repair_json(json_str: str) -> Tuple[dict, bool]:
             try:
                 repaired = repair(json_str)
                 parsed = json.loads(repaired)
-                print(f"Successfully repaired JSON using {repair.__name__}")
+                logger.info("Successfully repaired JSON using %s", repair.__name__)
                 return parsed, True
             except Exception as e:
-                print(f"{repair.__name__} failed: {e}")
+                logger.debug("%s failed: %s", repair.__name__, e)
                 continue
 
-        print("All repairs failed, retrying with LLM...")
+        logger.warning("All repairs failed, retrying with LLM...")
         from app.services.llm_service import LLMService
         llm_service = LLMService()
         response = await llm_service._call_ollama(
@@ -0,0 +1,29 @@
+import time
+from datetime import datetime, timezone
+
+# -----------------------------------------------------------------------------------------
+# UTC timestamps for response payloads
+#
+# Responses carry a "generated_at" stamp with one-second resolution. On a busy server many
+# responses share the same second, so the ISO string is formatted once per second and
+# reused. The returned value is timezone-aware ("...+00:00"), unlike datetime.utcnow().
+# -----------------------------------------------------------------------------------------
+
+_last_second = -1
+_last_timestamp = ""
+
+
+def utc_now() -> datetime:
+    """Current time as a timezone-aware UTC datetime"""
+    return datetime.now(timezone.utc)
+
+
+def utc_timestamp() -> str:
+    """Current UTC time in ISO 8601 format, to the second"""
+    global _last_second, _last_timestamp
+    second = int(time.time())
+    if second != _last_second:
+        # String first, then the second: a concurrent caller never pairs a new second with a stale string
+        _last_timestamp = datetime.fromtimestamp(second, timezone.utc).isoformat()
+        _last_second = second
+    return _last_timestamp